@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the personal data module
+
+Usage:
+    ./benchmark.py [-k NAME] [--save BASELINE.json]
+                   [--compare BASELINE.json] [--tolerance 0.2]
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import bcrypt
+
+import encrypt_password
+import filtered_logger
+
+PII_FIELDS = filtered_logger.PII_FIELDS
+RedactingFormatter = filtered_logger.RedactingFormatter
+RowRedactor = filtered_logger.RowRedactor
+filter_datum = filtered_logger.filter_datum
+format_row = filtered_logger.format_row
+
+PASSWORD = "MyAmazingPassw0rd"
+BCRYPT_COSTS = (4, 8, 10, 12)
+
+CORPORA = {
+    "short": "name=Bob;email=bob@dylan.com;ssn=000-123-0000;password=b0b;",
+    "long": ("name=Marlene Wood;email=hwestiii@att.net;phone=(473) 401-4253;"
+             "ssn=261-72-6780;password=K5?BMNv;"
+             "ip=60ed:c396:2ff:244:bbd0:9208:26f2:93ea;"
+             "last_login=2019-11-14 06:14:24;"
+             "user_agent=Mozilla/5.0 (Windows NT 10.0, Win64, x64) "
+             "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/74.0 "
+             "Safari/537.36;" * 4),
+    "many_fields": "".join(f"{field}=value{i};" for i in range(20)
+                           for field in PII_FIELDS + ("ip", "last_login")),
+    "no_pii": ("ip=f724:c5d1:a14d:c4c5:bae2:9457:3769:1969;"
+               "last_login=2019-11-14 06:16:19;"
+               "user_agent=Mozilla/5.0 (Linux, U, Android 4.1.2);" * 3),
+}
+
+PAYLOAD = {
+    "event": "login",
+    "user": {"id": "e2e761a8-5526-4d25-ab72-0ee107c3f257",
+             "name": "Marlene Wood", "email": "hwestiii@att.net",
+             "phone": "(473) 401-4253", "ssn": "261-72-6780",
+             "password": "K5?BMNv"},
+    "request": {"ip": "60ed:c396:2ff:244:bbd0:9208:26f2:93ea",
+                "user_agent": "Mozilla/5.0 (Windows NT 10.0, Win64, x64)",
+                "headers": [{"name": "Accept", "value": "*/*"}] * 4},
+    "last_login": "2019-11-14 06:14:24",
+}
+
+
+def flatten(payload: dict, prefix: str = "") -> str:
+    """Renders a payload as the `key=value;` text the regex path expects."""
+    parts = []
+    for key, value in payload.items():
+        if isinstance(value, dict):
+            parts.append(flatten(value, f"{prefix}{key}."))
+        else:
+            parts.append(f"{prefix}{key}={value};")
+    return "".join(parts)
+
+
+def serialize_then_format(formatter: logging.Formatter,
+                          record: logging.LogRecord) -> str:
+    """The text path for JSON: serialize the payload, then regex it."""
+    record.msg = json.dumps(PAYLOAD)
+    return formatter.format(record)
+
+
+def wide_row(width: int) -> Tuple[List[str], List[str]]:
+    """Builds a users row with `width` columns, PII columns first."""
+    columns = list(PII_FIELDS) + [f"col_{i}"
+                                  for i in range(width - len(PII_FIELDS))]
+    row = [f"value {i} (Mozilla/5.0; x64)" if i >= len(PII_FIELDS)
+           else f"pii value {i}" for i in range(width)]
+    return columns, row
+
+
+def measure(func: Callable[[], object], iterations: int) -> Dict[str, float]:
+    """
+    Times `iterations` calls of `func` one by one.
+    Returns:
+        The throughput and the p50/p99 latencies in microseconds.
+    """
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - start)
+    timings.sort()
+    total = sum(timings) or 1
+    return {
+        "ops_per_sec": iterations / (total / 1e9),
+        "p50_us": timings[len(timings) // 2] / 1e3,
+        "p99_us": timings[min(len(timings) - 1,
+                              int(len(timings) * 0.99))] / 1e3,
+    }
+
+
+def benchmarks() -> List[Tuple[str, Callable[[], object], int]]:
+    """Returns the (name, function, iterations) of every benchmark."""
+    cases = []
+    formatter = RedactingFormatter(PII_FIELDS)
+    for corpus, message in CORPORA.items():
+        cases.append((f"filter_datum[{corpus}]",
+                      lambda m=message: filter_datum(PII_FIELDS, "***", m,
+                                                     ";"),
+                      5000))
+        record = logging.LogRecord("user_data", logging.INFO, None, None,
+                                   message, None, None)
+        cases.append((f"RedactingFormatter.format[{corpus}]",
+                      lambda r=record: formatter.format(r), 5000))
+    structured = RedactingFormatter(PII_FIELDS, structured=True)
+    record = logging.LogRecord("user_data", logging.INFO, None, None,
+                               PAYLOAD, None, None)
+    cases.append(("RedactingFormatter.format[json_structured]",
+                  lambda r=record: structured.format(r), 5000))
+    record = logging.LogRecord("user_data", logging.INFO, None, None,
+                               flatten(PAYLOAD), None, None)
+    cases.append(("RedactingFormatter.format[json_flattened]",
+                  lambda r=record: formatter.format(r), 5000))
+    record = logging.LogRecord("user_data", logging.INFO, None, None,
+                               None, None, None)
+    cases.append(("RedactingFormatter.format[json_serialized]",
+                  lambda r=record: serialize_then_format(formatter, r),
+                  5000))
+    for width in (8, 128):
+        columns, row = wide_row(width)
+        redactor = RowRedactor(columns)
+        cases.append((f"row_regex[{width}]",
+                      lambda c=columns, r=row: filter_datum(
+                          PII_FIELDS, "***", format_row(c, r), ";"),
+                      2000))
+        cases.append((f"RowRedactor.format[{width}]",
+                      lambda r=row, red=redactor: red.format(r), 2000))
+        record = logging.LogRecord("user_data", logging.INFO, None, None,
+                                   redactor.message(row), None, None)
+        cases.append((f"RedactingFormatter.format[row_{width}]",
+                      lambda r=record: formatter.format(r), 2000))
+    for cost in BCRYPT_COSTS:
+        salt = bcrypt.gensalt(cost)
+        cases.append((f"bcrypt.hashpw[cost={cost}]",
+                      lambda s=salt: bcrypt.hashpw(PASSWORD.encode(), s),
+                      max(3, 2 ** (14 - cost))))
+    hashed = encrypt_password.hash_password(PASSWORD)
+    cases.append(("hash_password",
+                  lambda: encrypt_password.hash_password(PASSWORD), 5))
+    cases.append(("is_valid",
+                  lambda: encrypt_password.is_valid(hashed, PASSWORD), 5))
+    return cases
+
+
+def compare(results: Dict[str, Dict[str, float]],
+            baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """
+    Returns a description of every benchmark whose throughput dropped by
+    more than `tolerance` (a ratio) below the baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        floor = reference["ops_per_sec"] * (1 - tolerance)
+        if result["ops_per_sec"] < floor:
+            regressions.append("{}: {:.1f} ops/s < baseline {:.1f}".format(
+                name, result["ops_per_sec"], reference["ops_per_sec"]))
+    return regressions
+
+
+def main(argv: Sequence[str] = None) -> int:
+    """Runs the benchmarks; returns 1 when a regression is detected."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-k", dest="pattern", default="",
+                        help="only run benchmarks whose name contains this")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON baseline to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed throughput drop (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, func, iterations in benchmarks():
+        if args.pattern not in name:
+            continue
+        results[name] = measure(func, iterations)
+        print("{:<40} {:>12.1f} ops/s  p50 {:>10.1f} us  "
+              "p99 {:>10.1f} us".format(name, results[name]["ops_per_sec"],
+                                        results[name]["p50_us"],
+                                        results[name]["p99_us"]))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
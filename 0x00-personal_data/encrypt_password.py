@@ -2,8 +2,35 @@
 """
 Encrypting and Checking valid password
 """
+import asyncio
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
 import bcrypt
 
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', str(os.cpu_count() or 1)))
+BCRYPT_MAX_IN_FLIGHT = int(os.getenv('BCRYPT_MAX_IN_FLIGHT',
+                                     str(BCRYPT_WORKERS)))
+
+BCRYPT_COST = int(os.getenv('BCRYPT_COST', '12'))
+BCRYPT_TARGET_MS = float(os.getenv('BCRYPT_TARGET_MS', '250'))
+BCRYPT_MIN_COST = int(os.getenv('BCRYPT_MIN_COST', '10'))
+BCRYPT_MAX_COST = int(os.getenv('BCRYPT_MAX_COST', '16'))
+# Whether calibration may pick a cost below the BCRYPT_COST in use
+BCRYPT_ALLOW_LOWER = os.getenv('BCRYPT_ALLOW_LOWER', '').lower() in (
+    '1', 'true', 'yes')
+CALIBRATION = {}
+
+_executor = None
+_in_flight = threading.BoundedSemaphore(BCRYPT_MAX_IN_FLIGHT)
+_executor_lock = threading.Lock()
+# The asyncio.Semaphore queueing the coroutines of each event loop
+_loop_slots = weakref.WeakKeyDictionary()
+
 
 def hash_password(password: str) -> bytes:
     """
@@ -13,7 +40,7 @@ def hash_password(password: str) -> bytes:
     Returns:
         The hashed password as a byte string.
     """
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(BCRYPT_COST)
     hashed_password = bcrypt.hashpw(password.encode(), salt)
     return hashed_password
 
@@ -28,3 +55,236 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
         True - password matches the hashed password, otherwise False
     """
     return bcrypt.checkpw(password.encode(), hashed_password)
+
+
+def hash_cost(hashed_password: bytes) -> int:
+    """
+    Returns the cost factor a bcrypt hash was made with.
+    Args:
+        hashed_password: The hashed password, e.g. b'$2b$12$...'.
+    Returns:
+        The cost factor stored in the hash.
+    """
+    return int(hashed_password.split(b'$')[2])
+
+
+def is_valid_needs_rehash(hashed_password: bytes,
+                          password: str) -> Tuple[bool, bool]:
+    """
+    Validates a password and tells whether its hash should be replaced.
+    After a successful login, callers store `hash_password(password)`
+    when the second value is True.
+    Args:
+        hashed_password: The hashed password as a byte string.
+        password: The password to check.
+    Returns:
+        (valid, needs_rehash) - needs_rehash is True when the password is
+        valid and the hash uses a cost below the current BCRYPT_COST;
+        stronger hashes are kept.
+    """
+    if not is_valid(hashed_password, password):
+        return (False, False)
+    return (True, hash_cost(hashed_password) < BCRYPT_COST)
+
+
+def _time_hash(cost: int) -> float:
+    """Returns how many milliseconds one hash takes at `cost`."""
+    salt = bcrypt.gensalt(cost)
+    start = time.perf_counter()
+    bcrypt.hashpw(b"calibration password", salt)
+    return (time.perf_counter() - start) * 1000
+
+
+def calibrate_cost(target_ms: float = None, min_cost: int = None,
+                   max_cost: int = None, allow_lower: bool = None) -> int:
+    """
+    Picks the highest cost whose hash fits the target latency on this
+    machine and makes it the BCRYPT_COST used by `hash_password`.
+    Each extra cost unit doubles the work, so the time is measured once
+    at `min_cost` and extrapolated, then checked at the chosen cost.
+    A slow host keeps the cost already in use rather than weakening new
+    hashes, unless lowering it is allowed.
+    Args:
+        target_ms: the target hashing latency (default BCRYPT_TARGET_MS).
+        min_cost: the lowest acceptable cost (default BCRYPT_MIN_COST).
+        max_cost: the highest allowed cost (default BCRYPT_MAX_COST).
+        allow_lower: whether the cost may drop below BCRYPT_COST
+            (default BCRYPT_ALLOW_LOWER).
+    Returns:
+        The selected cost.
+    """
+    global BCRYPT_COST
+    target_ms = BCRYPT_TARGET_MS if target_ms is None else target_ms
+    min_cost = BCRYPT_MIN_COST if min_cost is None else min_cost
+    max_cost = BCRYPT_MAX_COST if max_cost is None else max_cost
+    allow_lower = BCRYPT_ALLOW_LOWER if allow_lower is None else allow_lower
+
+    cost = min_cost
+    elapsed = _time_hash(cost)
+    while cost < max_cost and elapsed * 2 <= target_ms:
+        cost += 1
+        elapsed *= 2
+    if cost > min_cost:
+        elapsed = _time_hash(cost)
+        if elapsed > target_ms:
+            cost -= 1
+            elapsed /= 2
+    if cost < BCRYPT_COST and not allow_lower:
+        cost = BCRYPT_COST
+        elapsed = _time_hash(cost)
+
+    BCRYPT_COST = cost
+    CALIBRATION.clear()
+    CALIBRATION.update({
+        'cost': cost,
+        'measured_ms': round(elapsed, 3),
+        'target_ms': target_ms,
+        'calibrated_at': time.time(),
+    })
+    return cost
+
+
+def cost_settings() -> Dict[str, object]:
+    """
+    Returns the bcrypt cost settings and the last calibration result,
+    for monitoring.
+    """
+    return {
+        'cost': BCRYPT_COST,
+        'target_ms': BCRYPT_TARGET_MS,
+        'min_cost': BCRYPT_MIN_COST,
+        'max_cost': BCRYPT_MAX_COST,
+        'allow_lower': BCRYPT_ALLOW_LOWER,
+        'calibration': dict(CALIBRATION),
+    }
+
+
+def configure(workers: int = None, max_in_flight: int = None) -> None:
+    """
+    Replaces the bcrypt worker pool.
+    bcrypt releases the GIL, so the pool scales across cores; the
+    in-flight bound keeps a burst of logins from using all of them.
+    Args:
+        workers: number of threads hashing in parallel.
+        max_in_flight: maximum number of hashes queued or running at once.
+    """
+    global _executor, _in_flight, BCRYPT_WORKERS, BCRYPT_MAX_IN_FLIGHT
+    with _executor_lock:
+        if workers is not None:
+            BCRYPT_WORKERS = workers
+        if max_in_flight is not None:
+            BCRYPT_MAX_IN_FLIGHT = max_in_flight
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+        _in_flight = threading.BoundedSemaphore(BCRYPT_MAX_IN_FLIGHT)
+        _loop_slots.clear()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Returns the bcrypt worker pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS,
+                                           thread_name_prefix="bcrypt")
+        return _executor
+
+
+def _submit(func, *args, block: bool = True) -> Future:
+    """
+    Runs `func(*args)` on the worker pool, waiting first for one of the
+    BCRYPT_MAX_IN_FLIGHT slots to be free.
+    Returns:
+        The Future of the call, or None if `block` is False and no slot
+        is free.
+    """
+    in_flight = _in_flight
+    if not in_flight.acquire(blocking=block):
+        return None
+    try:
+        future = _get_executor().submit(func, *args)
+    except Exception:
+        in_flight.release()
+        raise
+    future.add_done_callback(lambda _: in_flight.release())
+    return future
+
+
+def _loop_semaphore() -> asyncio.Semaphore:
+    """Returns the semaphore of the running loop, creating it if needed."""
+    loop = asyncio.get_running_loop()
+    semaphore = _loop_slots.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(BCRYPT_MAX_IN_FLIGHT)
+        _loop_slots[loop] = semaphore
+    return semaphore
+
+
+async def _run(func, *args):
+    """
+    Awaits `func(*args)` on the worker pool without blocking the loop.
+    Coroutines queue on a per-loop asyncio.Semaphore, so no thread is
+    parked while they wait for one of the BCRYPT_MAX_IN_FLIGHT slots.
+    """
+    async with _loop_semaphore():
+        future = _submit(func, *args, block=False)
+        delay = 0.001
+        while future is None:
+            # Slots held by synchronous callers or other loops: retry
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+            future = _submit(func, *args, block=False)
+        return await asyncio.wrap_future(future)
+
+
+async def hash_password_async(password: str) -> bytes:
+    """
+    Coroutine version of `hash_password` running on the worker pool.
+    Args:
+        password: The password to hash.
+    Returns:
+        The hashed password as a byte string.
+    """
+    return await _run(hash_password, password)
+
+
+async def is_valid_async(hashed_password: bytes, password: str) -> bool:
+    """
+    Coroutine version of `is_valid` running on the worker pool.
+    Args:
+        hashed_password: The hashed password as a byte string.
+        password: The password to check.
+    Returns:
+        True - password matches the hashed password, otherwise False
+    """
+    return await _run(is_valid, hashed_password, password)
+
+
+def hash_many(passwords: Iterable[str]) -> List[bytes]:
+    """
+    Hashes several passwords in parallel on the worker pool.
+    Args:
+        passwords: The passwords to hash.
+    Returns:
+        The hashed passwords, in the same order.
+    """
+    futures = [_submit(hash_password, password) for password in passwords]
+    return [future.result() for future in futures]
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]]) -> List[bool]:
+    """
+    Validates several (hashed_password, password) pairs in parallel.
+    Args:
+        pairs: The (hashed_password, password) pairs to check.
+    Returns:
+        The result of `is_valid` for each pair, in the same order.
+    """
+    futures = [_submit(is_valid, hashed, password)
+               for hashed, password in pairs]
+    return [future.result() for future in futures]
+
+
+if os.getenv('BCRYPT_CALIBRATE', '').lower() in ('1', 'true', 'yes'):
+    calibrate_cost()
@@ -4,32 +4,228 @@ Personal data: Contains functions for filtering sensitive data and logging
 """
 
 import re
+import json
 import logging
-from typing import List
+import queue
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Iterator, List, Sequence, Tuple
 import mysql.connector
+import mysql.connector.pooling
 import os
 
 
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
 
 
+class RedactionEngine:
+    """
+    Compiled redaction rules: every field is matched by one alternation
+    pattern so a log line is scanned once, whatever the number of fields.
+    """
+
+    def __init__(self, fields: Tuple[str, ...], redaction: str,
+                 separator: str):
+        """Compiles the pattern and replacement for the given rules."""
+        self.fields = fields
+        self.redaction = redaction
+        self.separator = separator
+        if fields:
+            self.pattern = re.compile(
+                rf"({'|'.join(fields)})=.*?{separator}")
+        else:
+            self.pattern = None
+        self.replacement = f"\\g<1>={redaction}{separator}"
+
+    def redact(self, message: str) -> str:
+        """Returns the message with every configured field obfuscated."""
+        if self.pattern is None:
+            return message
+        return self.pattern.sub(self.replacement, message)
+
+
+@lru_cache(maxsize=128)
+def _redaction_engine(fields: Tuple[str, ...], redaction: str,
+                      separator: str) -> RedactionEngine:
+    """Builds (once per rule set) the engine for the given rules."""
+    return RedactionEngine(fields, redaction, separator)
+
+
+def get_redaction_engine(fields: Sequence[str], redaction: str,
+                         separator: str) -> RedactionEngine:
+    """
+    Returns the cached RedactionEngine for `fields`, `redaction` and
+    `separator`, compiling it on first use.
+    """
+    return _redaction_engine(tuple(fields), redaction, separator)
+
+
 class RedactingFormatter(logging.Formatter):
     """Redacting Formatter class for log messages."""
     REDACTION = "***"
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
 
-    def __init__(self, fields: List[str]):
-        """Constructor for the RedactingFormatter class."""
+    def __init__(self, fields: List[str], structured: bool = False):
+        """
+        Constructor for the RedactingFormatter class.
+        Args:
+            fields: the fields to obfuscate.
+            structured: redact dict messages, and dicts passed as or
+                among the arguments, by key (nested keys included)
+                instead of by regex.
+        """
         self.fields = fields
+        self.structured = structured
+        self.field_set = frozenset(fields)
+        self.engine = get_redaction_engine(fields, self.REDACTION,
+                                           self.SEPARATOR)
         super(RedactingFormatter, self).__init__(self.FORMAT)
 
     def format(self, record: logging.LogRecord) -> str:
         """
-        Formats log message by redacting sensitive fields using `filter_datum`
+        Formats log message by redacting sensitive fields with the
+        formatter's compiled redaction engine. `RedactedRow` messages
+        whose redactor covers every field of the formatter are redacted
+        by column instead of by regex, and so are dict messages in
+        structured mode, redacted by key and serialized to JSON.
+        """
+        if type(record.msg) is RedactedRow and not record.args and \
+                self.field_set.issubset(record.msg.redactor.fields):
+            return super().format(record)
+        if self.structured and isinstance(record.msg, dict):
+            msg, args = record.msg, record.args
+            record.msg = json.dumps(self.redact_structure(msg), default=str)
+            record.args = None
+            try:
+                return super().format(record)
+            finally:
+                record.msg, record.args = msg, args
+        if self.structured and (
+                isinstance(record.args, dict) or
+                isinstance(record.args, tuple) and any(
+                    map(self.contains_dict, record.args))):
+            args = record.args
+            if isinstance(args, dict):
+                record.args = self.redact_structure(args)
+            else:
+                record.args = tuple(
+                    self.redact_structure(arg) if self.contains_dict(arg)
+                    else arg for arg in args)
+            try:
+                return self.engine.redact(super().format(record))
+            finally:
+                record.args = args
+        return self.engine.redact(super().format(record))
+
+    def redact_structure(self, data: Any) -> Any:
+        """
+        Returns a copy of a dict/list structure where the value of every
+        key in `fields`, at any depth, is replaced by the redaction.
+        Lists and tuples keep their type.
+        """
+        if isinstance(data, dict):
+            return {key: self.REDACTION if key in self.field_set
+                    else self.redact_structure(value)
+                    for key, value in data.items()}
+        if isinstance(data, (list, tuple)):
+            values = [self.redact_structure(value) for value in data]
+            if type(data) is list:
+                return values
+            if hasattr(data, '_make'):
+                return data._make(values)
+            return type(data)(values)
+        return data
+
+    @classmethod
+    def contains_dict(cls, data: Any) -> bool:
+        """Tells whether a list/tuple structure holds a dict at any depth."""
+        if isinstance(data, dict):
+            return True
+        if isinstance(data, (list, tuple)):
+            return any(map(cls.contains_dict, data))
+        return False
+
+
+class RedactedRow:
+    """
+    Log message of a database row, rendered by its `RowRedactor` when the
+    record is formatted (see `RowRedactor.message`).
+    """
+    __slots__ = ("redactor", "row")
+
+    def __init__(self, redactor: "RowRedactor", row: Sequence):
+        """Keeps the row and the redactor of its columns."""
+        self.redactor = redactor
+        self.row = row
+
+    def __str__(self) -> str:
+        """Returns the redacted `key=value; ` message of the row."""
+        return self.redactor.format(self.row)
+
+
+class RowRedactor:
+    """
+    Column-aware redaction of database rows: the PII positions are
+    computed once from the column names, so redacting a row is a lookup
+    by index instead of a regex scan of the formatted message.
+    """
+
+    def __init__(self, columns: Sequence[str],
+                 fields: Sequence[str] = PII_FIELDS):
+        """
+        Args:
+            columns: the column names, e.g. from `cursor.description`.
+            fields: the fields to obfuscate.
+        """
+        self.columns = tuple(columns)
+        self.fields = tuple(fields)
+        self.redaction = RedactingFormatter.REDACTION
+        self.separator = RedactingFormatter.SEPARATOR
+        # `name=` also matches inside `username=`, so mirror the regex by
+        # redacting every column whose name ends with a PII field.
+        self.pii = tuple(bool(self.fields) and column.endswith(self.fields)
+                         for column in self.columns)
+        self.prefixes = tuple(f"{column}=" for column in self.columns)
+        self.engine = get_redaction_engine(self.fields, self.redaction,
+                                           self.separator)
+
+    def redact_row(self, row: Sequence) -> Tuple[str, ...]:
+        """
+        Returns the row values as strings with the PII positions replaced
+        by the redaction.
         """
-        return filter_datum(self.fields, self.REDACTION,
-                            super().format(record), self.SEPARATOR)
+        redaction = self.redaction
+        return tuple(redaction if pii else str(value)
+                     for pii, value in zip(self.pii, row))
+
+    def format(self, row: Sequence) -> str:
+        """
+        Returns the redacted `key=value; ` message of a row, identical to
+        `filter_datum` applied to `format_row(columns, row)`.
+        """
+        redaction = self.redaction
+        separator = self.separator
+        parts = []
+        for prefix, pii, value in zip(self.prefixes, self.pii, row):
+            value = str(value)
+            # A PII value holding the separator (the regex stops at it) or
+            # another value holding `=` (it may hide a `field=` fragment)
+            # changes what the regex matches: defer to it for that row.
+            marker = separator if pii else "="
+            if marker in value:
+                return self.engine.redact(format_row(self.columns, row))
+            parts.append(prefix + redaction if pii else prefix + value)
+        return "; ".join(parts) + ";"
+
+    def message(self, row: Sequence) -> RedactedRow:
+        """
+        Returns the log message of a row: `RedactingFormatter` renders it
+        with this redactor instead of running its regex on the text.
+        """
+        return RedactedRow(self, row)
 
 
 def filter_datum(fields: List[str], redaction: str,
@@ -45,15 +241,74 @@ def filter_datum(fields: List[str], redaction: str,
     Returns:
         The obfuscated log message.
     """
-    for field in fields:
-        message = re.sub(rf"{field}=.*?{separator}",
-                         f"{field}={redaction}{separator}", message)
-    return message
+    return get_redaction_engine(fields, redaction, separator).redact(message)
 
 
-def get_logger() -> logging.Logger:
+class _RedactingQueueListener(QueueListener):
+    """
+    Queue listener whose shutdown sentinel waits for room in a full queue
+    instead of being lost, so every pending record is written on stop.
+    """
+
+    def enqueue_sentinel(self) -> None:
+        """Blocks until the stop sentinel fits in the queue."""
+        self.queue.put(self._sentinel)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue handler that only enqueues the raw LogRecord: formatting,
+    redaction and I/O all happen on the listener thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue, block: bool = False,
+                 timeout: float = None):
+        """
+        Args:
+            log_queue: the bounded queue shared with the listener.
+            block: wait for room when the queue is full instead of
+                dropping the record.
+            timeout: maximum time to wait when `block` is set.
+        """
+        super().__init__(log_queue)
+        self.block = block
+        self.timeout = timeout
+        self.dropped = 0
+        self.listener = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Hands the record over untouched; the listener formats it."""
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Enqueues the record, dropping it if the queue is full."""
+        if self.block:
+            self.queue.put(record, timeout=self.timeout)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """Stops the listener, flushing every queued record first."""
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+
+def get_logger(queued: bool = False, queue_size: int = 10000,
+               block: bool = False,
+               structured: bool = False) -> logging.Logger:
     """
     Creates a logger named "user_data" and returns it.
+    Args:
+        queued: when True the caller only enqueues records and a
+            background listener thread redacts and writes them.
+        queue_size: maximum number of records waiting in the queue.
+        block: when the queue is full, wait for room (True) or drop the
+            record (False).
+        structured: also redact dict messages and arguments by key.
     Returns:
         The created logger.
     """
@@ -62,8 +317,17 @@ def get_logger() -> logging.Logger:
     logger.propagate = False
 
     stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
-    logger.addHandler(stream_handler)
+    stream_handler.setFormatter(RedactingFormatter(PII_FIELDS, structured))
+    if not queued:
+        logger.addHandler(stream_handler)
+        return logger
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue, block=block)
+    queue_handler.listener = _RedactingQueueListener(
+        log_queue, stream_handler, respect_handler_level=True)
+    queue_handler.listener.start()
+    logger.addHandler(queue_handler)
 
     return logger
 
@@ -87,20 +351,129 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return db_connect
 
 
+class DBPool:
+    """
+    Bounded pool of database connections handed out as context managers.
+    Checkouts wait up to `timeout` seconds for a free connection instead
+    of failing as soon as the pool is exhausted.
+    """
+
+    def __init__(self, pool, size: int, timeout: float = 10.0):
+        """
+        Args:
+            pool: any object whose `get_connection()` returns a connection
+                that goes back to the pool on `close()`, such as a
+                `mysql.connector.pooling.MySQLConnectionPool`.
+            size: the number of connections in `pool`.
+            timeout: how long a checkout waits for a free connection.
+        """
+        self.pool = pool
+        self.size = size
+        self.timeout = timeout
+        self._available = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        """
+        Yields a pooled connection and returns it to the pool on exit.
+        Stale connections are validated lazily: the pool pings each one
+        on checkout and reconnects it if the server dropped it.
+        """
+        if not self._available.acquire(timeout=self.timeout):
+            raise mysql.connector.pooling.PoolError(
+                "Failed getting connection; pool exhausted")
+        try:
+            db_connection = self.pool.get_connection()
+        except Exception:
+            self._available.release()
+            raise
+        try:
+            yield db_connection
+        finally:
+            try:
+                db_connection.close()
+            finally:
+                self._available.release()
+
+
+@lru_cache(maxsize=None)
+def get_db_pool() -> DBPool:
+    """
+    Returns the process-wide connection pool, created on first use from
+    the same environment variables as `get_db`, plus
+    `PERSONAL_DATA_DB_POOL_SIZE` (default 5) and
+    `PERSONAL_DATA_DB_POOL_TIMEOUT` in seconds (default 10).
+    Returns:
+        The DBPool wrapping a MySQLConnectionPool.
+    """
+    size = int(os.getenv('PERSONAL_DATA_DB_POOL_SIZE', '5'))
+    timeout = float(os.getenv('PERSONAL_DATA_DB_POOL_TIMEOUT', '10'))
+    pool = mysql.connector.pooling.MySQLConnectionPool(
+        pool_name="personal_data",
+        pool_size=size,
+        user=os.getenv('PERSONAL_DATA_DB_USERNAME', 'root'),
+        password=os.getenv('PERSONAL_DATA_DB_PASSWORD', ''),
+        host=os.getenv('PERSONAL_DATA_DB_HOST', 'localhost'),
+        database=os.getenv('PERSONAL_DATA_DB_NAME'))
+    return DBPool(pool, size, timeout)
+
+
+def format_row(columns: Sequence[str], row: Sequence) -> str:
+    """
+    Builds the `key=value; ` log message of a database row.
+    Args:
+        columns: the column names, in the order of the row values.
+        row: the column values.
+    Returns:
+        The message, ending with the separator of its last field.
+    """
+    return "; ".join(f"{column}={value}"
+                     for column, value in zip(columns, row)) + ";"
+
+
+def export_users(db_connection, logger: logging.Logger,
+                 batch_size: int = 1000) -> int:
+    """
+    Streams every row of the `users` table through the redacting logger.
+    PII columns are redacted by position with a `RowRedactor`, whose
+    `RedactedRow` messages the redacting formatter renders. Rows are
+    read `batch_size` at a time from an unbuffered cursor, so
+    memory stays flat whatever the size of the table.
+    Args:
+        db_connection: an open database connection.
+        logger: the logger rows are written to, e.g. `get_logger()`.
+        batch_size: the number of rows fetched per round trip.
+    Returns:
+        The number of exported rows.
+    """
+    cursor = db_connection.cursor()
+    exported = 0
+    try:
+        cursor.execute("SELECT * FROM users")
+        redactor = RowRedactor([column[0] for column in cursor.description])
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                logger.info(redactor.message(row))
+            exported += len(rows)
+    finally:
+        cursor.close()
+    return exported
+
+
 def main():
     """
-    The main function that retrieves data from the database and prints it.
+    The main function that retrieves data from the database and logs each
+    row with its PII fields redacted.
     """
+    batch_size = int(os.getenv('PERSONAL_DATA_EXPORT_BATCH_SIZE', '1000'))
     db_connection = get_db()
-    cursor = db_connection.cursor()
-    cursor.execute("SELECT * FROM users")
-    data = cursor.fetchall()
-    for row in data:
-        for column_value in row:
-            print(column_value)
-
-    cursor.close()
-    db_connection.close()
+    try:
+        export_users(db_connection, get_logger(), batch_size)
+    finally:
+        db_connection.close()
 
 
 if __name__ == '__main__':
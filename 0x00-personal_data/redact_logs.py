@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Redacts existing log files with the `filter_datum` rules, in parallel
+"""
+import argparse
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Sequence, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum
+
+
+def chunk_bounds(path: str, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits a file into line-aligned chunks of about `chunk_size` bytes.
+    Args:
+        path: the file to split.
+        chunk_size: the target size of each chunk, in bytes.
+    Returns:
+        The (start, end) byte offsets of each chunk, in file order.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    bounds = []
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = data.find(b"\n", min(start + chunk_size, size) - 1)
+            end = size if end == -1 else end + 1
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+
+def redact_chunk(path: str, start: int, end: int, fields: Sequence[str],
+                 redaction: str, separator: str) -> bytes:
+    """
+    Redacts the lines between two byte offsets of a file.
+    Returns:
+        The redacted bytes of the chunk.
+    """
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode('utf-8', 'surrogateescape')
+    return filter_datum(fields, redaction, text, separator).encode(
+        'utf-8', 'surrogateescape')
+
+
+def redact_file(source: str, destination: str, fields: Sequence[str],
+                redaction: str, separator: str, workers: int,
+                chunk_size: int) -> int:
+    """
+    Redacts `source` into `destination` across a pool of processes.
+    At most two chunks per worker are in flight, and they are written
+    in their original order.
+    Returns:
+        The number of bytes read from `source`.
+    Raises:
+        ValueError: if `destination` is `source`, which the workers map
+        while it would be truncated.
+    """
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        raise ValueError("destination {} is the source file".format(
+            destination))
+    bounds = chunk_bounds(source, chunk_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            open(destination, 'wb') as out:
+        pending = deque()
+        for start, end in bounds:
+            pending.append(executor.submit(redact_chunk, source, start, end,
+                                           fields, redaction, separator))
+            if len(pending) >= 2 * workers:
+                out.write(pending.popleft().result())
+        while pending:
+            out.write(pending.popleft().result())
+    return bounds[-1][1] if bounds else 0
+
+
+def parse_args(argv: Sequence[str] = None) -> argparse.Namespace:
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Redact PII fields from existing log files.")
+    parser.add_argument("source", help="the log file to redact")
+    parser.add_argument("destination", help="where to write the result")
+    parser.add_argument("-f", "--fields", default=",".join(PII_FIELDS),
+                        help="comma separated fields to obfuscate "
+                             "(default: %(default)s)")
+    parser.add_argument("-s", "--separator",
+                        default=RedactingFormatter.SEPARATOR,
+                        help="field separator (default: %(default)s)")
+    parser.add_argument("-r", "--redaction",
+                        default=RedactingFormatter.REDACTION,
+                        help="replacement value (default: %(default)s)")
+    parser.add_argument("-w", "--workers", type=int,
+                        default=os.cpu_count() or 1,
+                        help="number of worker processes "
+                             "(default: %(default)s)")
+    parser.add_argument("-c", "--chunk-size", type=int, default=8,
+                        help="chunk size in MiB (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str] = None) -> None:
+    """Redacts a log file and reports the throughput on stderr."""
+    args = parse_args(argv)
+    fields = [field for field in args.fields.split(",") if field]
+    started = time.perf_counter()
+    try:
+        size = redact_file(args.source, args.destination, fields,
+                           args.redaction, args.separator,
+                           max(args.workers, 1),
+                           max(args.chunk_size, 1) * 1024 * 1024)
+    except ValueError as e:
+        sys.exit("redact_logs: {}".format(e))
+    elapsed = time.perf_counter() - started
+    print("redacted {:.1f} MB in {:.2f}s ({:.1f} MB/s)".format(
+        size / 1e6, elapsed, size / 1e6 / elapsed if elapsed else 0.0),
+        file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
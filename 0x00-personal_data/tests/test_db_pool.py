@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests of DBPool against a fake connection pool
+
+Run from 0x00-personal_data:
+    python3 -m unittest discover tests
+"""
+import time
+import unittest
+
+import mysql.connector.pooling
+
+from filtered_logger import DBPool
+
+
+class FakeConnection:
+    """Connection whose close() returns it to its FakePool."""
+
+    def __init__(self, pool: "FakePool"):
+        """Initializes an open connection of `pool`."""
+        self.pool = pool
+        self.closed = False
+
+    def close(self) -> None:
+        """Returns the connection to the pool."""
+        self.closed = True
+        self.pool.returned += 1
+
+
+class FakePool:
+    """Stand-in for MySQLConnectionPool, optionally failing checkouts."""
+
+    def __init__(self, failures: int = 0):
+        """Initializes a pool whose first `failures` checkouts raise."""
+        self.failures = failures
+        self.checked_out = 0
+        self.returned = 0
+
+    def get_connection(self) -> FakeConnection:
+        """Returns a new connection, or raises while failures remain."""
+        if self.failures > 0:
+            self.failures -= 1
+            raise mysql.connector.Error("server gone")
+        self.checked_out += 1
+        return FakeConnection(self)
+
+
+class TestDBPool(unittest.TestCase):
+    """Checkout, return and exhaustion of DBPool connections."""
+
+    def test_connection_returned_on_exit(self):
+        """The connection is closed and its slot freed after the block."""
+        pool = DBPool(FakePool(), size=1, timeout=0.1)
+        with pool.connection() as db_connection:
+            self.assertFalse(db_connection.closed)
+        self.assertTrue(db_connection.closed)
+        with pool.connection():
+            pass
+        self.assertEqual(pool.pool.returned, 2)
+
+    def test_connection_returned_when_body_raises(self):
+        """An exception in the block still returns the connection."""
+        pool = DBPool(FakePool(), size=1, timeout=0.1)
+        with self.assertRaises(ValueError):
+            with pool.connection() as db_connection:
+                raise ValueError("query failed")
+        self.assertTrue(db_connection.closed)
+        with pool.connection():
+            pass
+        self.assertEqual(pool.pool.returned, 2)
+
+    def test_exhausted_pool_raises_after_timeout(self):
+        """A checkout waits `timeout` seconds, then raises PoolError."""
+        pool = DBPool(FakePool(), size=1, timeout=0.2)
+        with pool.connection():
+            start = time.monotonic()
+            with self.assertRaises(mysql.connector.pooling.PoolError):
+                with pool.connection():
+                    pass
+            self.assertGreaterEqual(time.monotonic() - start, 0.18)
+        self.assertEqual(pool.pool.checked_out, 1)
+
+    def test_get_connection_failure_releases_slot(self):
+        """A failing get_connection() does not leak the pool slot."""
+        pool = DBPool(FakePool(failures=1), size=1, timeout=0.1)
+        with self.assertRaises(mysql.connector.Error):
+            with pool.connection():
+                pass
+        with pool.connection() as db_connection:
+            self.assertFalse(db_connection.closed)
+        self.assertEqual(pool.pool.returned, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
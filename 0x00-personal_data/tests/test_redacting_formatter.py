@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests of the structured mode of RedactingFormatter
+
+Run from 0x00-personal_data:
+    python3 -m unittest discover tests
+"""
+import logging
+import unittest
+
+from filtered_logger import PII_FIELDS, RedactingFormatter
+
+
+def make_record(msg, args) -> logging.LogRecord:
+    """Builds an INFO record of the user_data logger."""
+    return logging.LogRecord("user_data", logging.INFO, None, None,
+                             msg, args, None)
+
+
+class TestStructuredFormatter(unittest.TestCase):
+    """Dict messages and arguments are redacted by key."""
+
+    def setUp(self):
+        """Creates a structured formatter of the PII fields."""
+        self.formatter = RedactingFormatter(PII_FIELDS, structured=True)
+
+    def test_dict_message(self):
+        """Nested PII keys of a dict message are redacted."""
+        output = self.formatter.format(make_record(
+            {"user": {"email": "bob@dylan.com", "id": 1}}, None))
+        self.assertIn('"email": "***"', output)
+        self.assertIn('"id": 1', output)
+
+    def test_dict_args(self):
+        """A dict passed as the arguments is redacted."""
+        output = self.formatter.format(make_record(
+            "login %(email)s from %(ip)s",
+            {"email": "bob@dylan.com", "ip": "10.0.0.1"}))
+        self.assertTrue(output.endswith("login *** from 10.0.0.1"))
+
+    def test_dicts_in_tuple_args(self):
+        """Dicts and lists among positional arguments are redacted."""
+        payload = {"user": {"ssn": "000-12-3456"}, "password": "b0b"}
+        record = make_record("%s %s %s", ("bob", payload, [{"phone": "1"}]))
+        output = self.formatter.format(record)
+        self.assertNotIn("000-12-3456", output)
+        self.assertNotIn("b0b", output)
+        self.assertIn("{'phone': '***'}", output)
+        self.assertIs(record.args[1], payload)
+        self.assertEqual(payload["password"], "b0b")
+
+    def test_containers_keep_their_type(self):
+        """Tuples are not turned into lists, with or without dicts."""
+        output = self.formatter.format(make_record("%s", ((1, 2),)))
+        self.assertTrue(output.endswith(" (1, 2)"))
+        output = self.formatter.format(make_record(
+            "%s %s", ((1, 2), ({"email": "bob@dylan.com"},))))
+        self.assertTrue(output.endswith(" (1, 2) ({'email': '***'},)"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,6 +13,12 @@ app = Flask(__name__)
 app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 auth = None
+EXCLUDED_PATHS = (
+    '/api/v1/status/',
+    '/api/v1/unauthorized/',
+    '/api/v1/forbidden/',
+    '/api/v1/auth_session/login/',
+)
 
 if getenv('AUTH_TYPE') == 'auth':
     from api.v1.auth.auth import Auth
@@ -58,21 +64,24 @@ def before_request() -> str:
     """
     if auth is None:
         return
-    if auth.require_auth(
-            path=request.path,
-            exclude_paths=[
-                '/api/v1/status/',
-                '/api/v1/unauthorized/',
-                '/api/v1/forbidden/',
-                '/api/v1/auth_session/login/',
-            ],
-    ):
+    if auth.require_auth(path=request.path, exclude_paths=EXCLUDED_PATHS):
         if auth.authorization_header(request) is None and auth.session_cookie(
                 request) is None:
             abort(401)
-        if auth.current_user(request) is None:
+        if auth.resolve_current_user(request) is None:
             abort(403)
-    request.current_user = auth.current_user(request)
+    request.current_user = auth.resolve_current_user(request)
+
+
+@app.after_request
+def after_request(response):
+    """ Report how long resolving the current user took
+    """
+    duration = getattr(request, 'auth_resolution_ms', None)
+    if duration is not None:
+        response.headers.add('Server-Timing',
+                             'auth;dur={:.3f}'.format(duration))
+    return response
 
 
 if __name__ == "__main__":
@@ -3,11 +3,114 @@
 Auth module for the API
 """
 import re
+import time
+from functools import lru_cache
 from os import getenv
-from typing import List, TypeVar
+from typing import List, Sequence, TypeVar
 
 from flask import request
 
+# Regex syntax an exclude path may use besides the `*` wildcard
+REGEX_METACHARACTERS = frozenset(".^$+?{}[]\\|()")
+# Syntax that may define or refer to groups, whose numbers and inline
+# flags would change once merged with other paths
+GROUP_CHARACTERS = frozenset("(\\")
+
+
+def _trie_source(node: dict) -> str:
+    """
+    Returns the regex source matching any path of a trie of characters.
+    A node where a path ends matches as is: only whether something
+    matches is needed, not how far.
+    """
+    if None in node:
+        return ""
+    branches = [(".*" if key == "*" else re.escape(key)) +
+                _trie_source(child) for key, child in node.items()]
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+
+class PathMatcher:
+    """
+    The exclude paths of `Auth.require_auth` compiled into one regex.
+    Plain paths (with `*` wildcards) are merged into a prefix trie, so a
+    lookup does not depend on how many of them there are; paths using
+    other regex syntax are added as alternatives of their own. Paths
+    with groups or escapes (`(`, `\\`) are never merged: a backreference
+    would silently point to another group, so each of them is compiled
+    and searched on its own.
+    """
+
+    def __init__(self, exclude_paths: Sequence[str]):
+        """Compiles the exclude paths."""
+        self.sources = [exclude_path.replace('/', '\\/').replace('*', '.*')
+                        for exclude_path in exclude_paths]
+        trie, branches = {}, []
+        self.regex, self.patterns = None, []
+        try:
+            for exclude_path, source in zip(exclude_paths, self.sources):
+                if REGEX_METACHARACTERS.isdisjoint(exclude_path):
+                    node = trie
+                    for char in exclude_path:
+                        node = node.setdefault(char, {})
+                    node[None] = {}
+                    continue
+                # Checked on its own first: once merged, an open `[`
+                # could swallow the paths after it
+                pattern = re.compile(source)
+                if GROUP_CHARACTERS.isdisjoint(exclude_path):
+                    branches.append("(?:" + source + ")")
+                else:
+                    self.patterns.append(pattern)
+        except re.error:
+            # An invalid path: search the paths one by one, in order, so
+            # it raises only if no path before it matches, as before
+            self.patterns = None
+            return
+        if trie:
+            branches.insert(0, _trie_source(trie))
+        if branches:
+            self.regex = re.compile("|".join(branches))
+
+    def matches(self, path: str) -> bool:
+        """Tells whether any exclude path is found in `path`."""
+        if self.patterns is None:
+            for source in self.sources:
+                if re.search(source, path):
+                    return True
+            return False
+        if self.regex is not None and self.regex.search(path):
+            return True
+        for pattern in self.patterns:
+            if pattern.search(path):
+                return True
+        return False
+
+
+@lru_cache(maxsize=64)
+def _compiled_matcher(exclude_paths: tuple) -> PathMatcher:
+    """Returns the PathMatcher of an exclude tuple, compiled once."""
+    return PathMatcher(exclude_paths)
+
+
+# The last exclude tuple matched and its matcher: callers passing the
+# same constant tuple on every request skip hashing it
+_last_matcher = (None, None)
+
+
+def path_matcher(exclude_paths: Sequence[str]) -> PathMatcher:
+    """Returns the PathMatcher of an exclude list, compiled once."""
+    global _last_matcher
+    paths, matcher = _last_matcher
+    if exclude_paths is paths:
+        return matcher
+    matcher = _compiled_matcher(tuple(exclude_paths))
+    if type(exclude_paths) is tuple:
+        _last_matcher = (exclude_paths, matcher)
+    return matcher
+
 
 class Auth:
     """A class to manage the API authentication"""
@@ -23,12 +126,7 @@ class Auth:
         if path is None or exclude_paths is None or exclude_paths == []:
             return True
         path = path + '/' if path[-1] != '/' else path
-        for exclude_path in exclude_paths:
-            exclude_path = exclude_path.replace('/', '\\/').replace('*', '.*')
-            regex = re.compile(exclude_path)
-            if regex.search(path):
-                return False
-        return True
+        return not path_matcher(exclude_paths).matches(path)
 
     def authorization_header(self, request=None) -> str:
         """
@@ -51,6 +149,27 @@ class Auth:
         """
         return None
 
+    def resolve_current_user(self, request=None) -> TypeVar('User'):
+        """
+        Returns `current_user(request)`, computed once per request.
+        The user is kept on the request, with the time the lookup took
+        in milliseconds as `request.auth_resolution_ms`.
+        Args:
+            request: The request object.
+        Returns:
+            The current user, or None.
+        """
+        if request is None:
+            return self.current_user(request)
+        resolved = getattr(request, '_auth_resolved', None)
+        if resolved is not None and resolved[0] is self:
+            return resolved[1]
+        start = time.perf_counter()
+        user = self.current_user(request)
+        request.auth_resolution_ms = (time.perf_counter() - start) * 1000
+        request._auth_resolved = (self, user)
+        return user
+
     def session_cookie(self, request=None):
         """
         Returns the current user.
@@ -2,16 +2,242 @@
 """
 Basic authentication module for the API
 """
+import hashlib
+import os
+import threading
+import time
 from base64 import b64decode
-from typing import Tuple, TypeVar
+from collections import OrderedDict
+from typing import Dict, Tuple, TypeVar
 
 from api.v1.auth.auth import Auth
 from models.user import User
 
+CREDENTIAL_CACHE_SIZE = int(os.getenv('BASIC_AUTH_CACHE_SIZE', '10000'))
+CREDENTIAL_CACHE_TTL = float(os.getenv('BASIC_AUTH_CACHE_TTL', '60'))
+# Failed attempts: how long a failing header is answered from memory,
+# and the token bucket (refill per second, capacity) of each email and
+# client address; each table tracks at most BASIC_AUTH_TRACKED entries.
+# A throttled email still gets its password checked from an address
+# without recent failures, so guessing cannot lock its owner out
+FAILURE_TTL = float(os.getenv('BASIC_AUTH_FAILURE_TTL', '10'))
+FAILURE_RATE = float(os.getenv('BASIC_AUTH_FAILURE_RATE', '0.5'))
+FAILURE_BURST = float(os.getenv('BASIC_AUTH_FAILURE_BURST', '10'))
+TRACKED = int(os.getenv('BASIC_AUTH_TRACKED', '10000'))
+
+
+class CredentialCache:
+    """
+    Authorization headers already verified, mapped to their user id.
+    Headers are stored as a keyed BLAKE2 digest (a MAC under a
+    per-process key), never in clear. Entries expire after `ttl`
+    seconds, and the least recently used one is dropped past `size`
+    entries. A hit is only served if
+    the user still exists with the same email and password hash, so a
+    password change or a removal invalidates the entry.
+    """
+
+    def __init__(self, size: int = CREDENTIAL_CACHE_SIZE,
+                 ttl: float = CREDENTIAL_CACHE_TTL):
+        """Initializes an empty cache."""
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, authorization_header: str) -> bytes:
+        """Returns the keyed digest identifying a header."""
+        return hashlib.blake2b(authorization_header.encode(),
+                               key=self._secret, digest_size=16).digest()
+
+    def get(self, authorization_header: str) -> TypeVar('User'):
+        """
+        Returns the user a header was verified for, or None on a miss.
+        Args:
+            authorization_header: The Authorization header value.
+        """
+        key = self._key(authorization_header)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[3] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        user_id, email, password = entry[:3]
+        user = User.get(user_id)
+        if user is None or user.email != email or user.password != password:
+            with self._lock:
+                self._entries.pop(key, None)
+                self.invalidations += 1
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return user
+
+    def put(self, authorization_header: str, user: TypeVar('User')):
+        """
+        Records that a header was verified for `user`.
+        Args:
+            authorization_header: The Authorization header value.
+            user: The User the credentials belong to.
+        """
+        if self.size <= 0:
+            return
+        key = self._key(authorization_header)
+        entry = (user.id, user.email, user.password,
+                 time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drops every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the size and the hit/miss counters of the cache."""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits,
+                    'misses': self.misses,
+                    'invalidations': self.invalidations}
+
+
+class FailureCache:
+    """
+    Authorization headers that recently failed, as keyed digests.
+    A header seen here is rejected without any lookup for `ttl`
+    seconds, so a new account or password matching it is only accepted
+    once the entry expires. At most `size` headers are kept.
+    """
+
+    def __init__(self, size: int = TRACKED, ttl: float = FAILURE_TTL):
+        """Initializes an empty cache."""
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, authorization_header: str) -> bytes:
+        """Returns the keyed digest identifying a header."""
+        return hashlib.blake2b(authorization_header.encode(),
+                               key=self._secret, digest_size=16).digest()
+
+    def __contains__(self, authorization_header: str) -> bool:
+        """Tells whether a header failed less than `ttl` seconds ago."""
+        key = self._key(authorization_header)
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return False
+            self.hits += 1
+            return True
+
+    def add(self, authorization_header: str):
+        """Records a failed header."""
+        if self.size <= 0:
+            return
+        key = self._key(authorization_header)
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+class TokenBuckets:
+    """
+    One token bucket of failed attempts per source (email or address).
+    A source starts with `burst` tokens, each failure takes one, and
+    `rate` tokens come back per second; a source without a token left
+    is throttled. Buckets that are full again are forgotten, and past
+    `size` sources the least recently active one is dropped.
+    """
+
+    def __init__(self, rate: float = FAILURE_RATE,
+                 burst: float = FAILURE_BURST, size: int = TRACKED):
+        """Initializes the buckets, all full."""
+        self.rate = rate
+        self.burst = burst
+        self.size = size
+        self.throttled = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tokens(self, source, now: float) -> float:
+        """Returns the tokens of a source, refilled up to `now`."""
+        tokens, updated = self._buckets.get(source, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def allow(self, source) -> bool:
+        """Tells whether a source may make an attempt."""
+        if source is None:
+            return True
+        with self._lock:
+            if source not in self._buckets:
+                return True
+            tokens = self._tokens(source, time.monotonic())
+            if tokens >= self.burst:
+                del self._buckets[source]
+            if tokens < 1:
+                self.throttled += 1
+                return False
+            return True
+
+    def clean(self, source) -> bool:
+        """Tells whether a known source has no failure left to refill."""
+        if source is None:
+            return False
+        with self._lock:
+            if source not in self._buckets:
+                return True
+            return self._tokens(source, time.monotonic()) >= self.burst
+
+    def consume(self, source):
+        """Takes the token of a failed attempt from a source."""
+        if source is None or self.size <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._buckets[source] = (max(self._tokens(source, now) - 1, 0),
+                                     now)
+            self._buckets.move_to_end(source)
+            while len(self._buckets) > self.size:
+                self._buckets.popitem(last=False)
+
+    def __len__(self) -> int:
+        """Returns the number of sources tracked."""
+        return len(self._buckets)
+
 
 class BasicAuth(Auth):
     """A basic auth class to manage the API authentication"""
 
+    def __init__(self):
+        """
+        Initializes the cache of verified credentials, the cache of
+        failed ones and the throttles of failing emails and addresses.
+        """
+        self.credential_cache = CredentialCache()
+        self.failure_cache = FailureCache()
+        self.email_throttle = TokenBuckets()
+        self.address_throttle = TokenBuckets()
+
     def extract_base64_authorization_header(self,
                                             authorization_header: str) -> str:
         """
@@ -100,7 +326,42 @@ class BasicAuth(Auth):
         """
         header = self.authorization_header(request)
         base64_header = self.extract_base64_authorization_header(header)
+        if base64_header is None:
+            return None
+        user = self.credential_cache.get(header)
+        if user is not None:
+            return user
+        # Failing sources are turned away before any model lookup
+        address = getattr(request, 'remote_addr', None)
+        if not self.address_throttle.allow(address):
+            return None
+        if header in self.failure_cache:
+            self.address_throttle.consume(address)
+            return None
         decoded_header = self.decode_base64_authorization_header(base64_header)
         user_credentials = self.extract_user_credentials(decoded_header)
-        return self.user_object_from_credentials(user_credentials[0],
+        email = user_credentials[0]
+        # A throttled email only stops addresses that failed recently: the
+        # owner logging in from a clean address is still checked
+        if not self.address_throttle.clean(address) and \
+                not self.email_throttle.allow(email):
+            return None
+        user = self.user_object_from_credentials(user_credentials[0],
                                                  user_credentials[1])
+        if user is not None:
+            self.credential_cache.put(header, user)
+            return user
+        self.failure_cache.add(header)
+        self.address_throttle.consume(address)
+        self.email_throttle.consume(email)
+        return None
+
+    def throttle_stats(self) -> Dict[str, int]:
+        """
+        Returns the counters of the failure cache and the throttles.
+        """
+        return {'failure_cache_hits': self.failure_cache.hits,
+                'emails_throttled': self.email_throttle.throttled,
+                'addresses_throttled': self.address_throttle.throttled,
+                'emails_tracked': len(self.email_throttle),
+                'addresses_tracked': len(self.address_throttle)}
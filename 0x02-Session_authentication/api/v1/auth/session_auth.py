@@ -2,15 +2,138 @@
 """
 Session Authentication module for the API
 """
+import heapq
+import threading
+import time
+from typing import Dict
 from uuid import uuid4
 
 from api.v1.auth.auth import Auth
 from models.user import User
 
 
+class SessionStore(dict):
+    """
+    Session IDs mapped to their session, deleted once they expire.
+    Expiring sessions are also kept in a heap ordered by expiry time:
+    every write first deletes the sessions whose time has passed, so
+    memory stays bounded by the live sessions, at O(log n) per session.
+    Every dict method that writes is overridden to keep them in sync.
+    """
+
+    def __init__(self):
+        """Initializes an empty store."""
+        super().__init__()
+        self.expired = 0
+        self._expiries = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def set(self, session_id: str, session, ttl: float = None):
+        """
+        Stores a session, deleted after `ttl` seconds if given.
+        Args:
+            session_id: The session ID.
+            session: The session data.
+            ttl: The lifetime of the session in seconds, or None.
+        """
+        with self._lock:
+            self._set(session_id, session, ttl)
+
+    def _set(self, session_id: str, session, ttl: float = None):
+        """Stores a session, as `set` does; the lock is held."""
+        self._sweep(time.monotonic())
+        dict.__setitem__(self, session_id, session)
+        self._expiries.pop(session_id, None)
+        if ttl is not None:
+            expires = time.monotonic() + ttl
+            self._expiries[session_id] = expires
+            heapq.heappush(self._heap, (expires, session_id))
+
+    def __setitem__(self, session_id: str, session):
+        """Stores a session that does not expire."""
+        self.set(session_id, session)
+
+    def setdefault(self, session_id: str, session=None):
+        """
+        Returns a session, first storing `session` (which does not
+        expire) if there is none.
+        """
+        with self._lock:
+            if dict.__contains__(self, session_id):
+                return dict.__getitem__(self, session_id)
+            self._set(session_id, session)
+            return session
+
+    def update(self, *args, **kwargs):
+        """Stores sessions that do not expire."""
+        with self._lock:
+            for session_id, session in dict(*args, **kwargs).items():
+                self._set(session_id, session)
+
+    def __ior__(self, other):
+        """Stores sessions that do not expire (`|=`)."""
+        self.update(other)
+        return self
+
+    def __delitem__(self, session_id: str):
+        """Deletes a session."""
+        with self._lock:
+            dict.__delitem__(self, session_id)
+            self._expiries.pop(session_id, None)
+
+    def pop(self, session_id: str, *default):
+        """Deletes a session and returns it."""
+        with self._lock:
+            self._expiries.pop(session_id, None)
+            return dict.pop(self, session_id, *default)
+
+    def popitem(self) -> tuple:
+        """Deletes the last stored session and returns it with its ID."""
+        with self._lock:
+            session_id, session = dict.popitem(self)
+            self._expiries.pop(session_id, None)
+            return session_id, session
+
+    def clear(self):
+        """Deletes every session."""
+        with self._lock:
+            dict.clear(self)
+            self._expiries.clear()
+            self._heap = []
+
+    def _sweep(self, now: float):
+        """Deletes the sessions expired at `now`; the lock is held."""
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires, session_id = heapq.heappop(heap)
+            # Skip the entries of sessions deleted or stored again since
+            if self._expiries.get(session_id) == expires:
+                del self._expiries[session_id]
+                dict.pop(self, session_id, None)
+                self.expired += 1
+        if len(heap) > 2 * len(self._expiries) + 64:
+            self._heap = [(expires, session_id) for session_id, expires
+                          in self._expiries.items()]
+            heapq.heapify(self._heap)
+
+    def sweep(self):
+        """Deletes every expired session now."""
+        with self._lock:
+            self._sweep(time.monotonic())
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of live sessions and of the sessions deleted
+        because they expired.
+        """
+        self.sweep()
+        return {'live': len(self), 'expired': self.expired}
+
+
 class SessionAuth(Auth):
     """A session auth class to manage the API authentication"""
-    user_id_by_session_id = {}
+    user_id_by_session_id = SessionStore()
 
     def create_session(self, user_id: str = None) -> str:
         """
@@ -70,5 +193,5 @@ class SessionAuth(Auth):
         user_id = self.user_id_for_session_id(session_cookie)
         if not user_id:
             return False
-        del self.user_id_by_session_id[session_cookie]
+        self.user_id_by_session_id.pop(session_cookie, None)
         return True
@@ -37,7 +37,9 @@ class SessionDBAuth(SessionExpAuth):
         """
         if session_id is None:
             return None
-        UserSession.load_from_file()
+        # Pick up the sessions other workers wrote, without re-reading
+        # the file when nothing changed
+        UserSession.reload_if_changed()
         user_session = UserSession.search({'session_id': session_id})
         if len(user_session) == 0:
             return None
@@ -69,6 +71,7 @@ class SessionDBAuth(SessionExpAuth):
         user_session = UserSession.search({'session_id': session_cookie})
         if len(user_session) == 0:
             return False
-        del self.user_id_by_session_id[session_cookie]
+        # Gone from memory if expired, or if created by another worker
+        self.user_id_by_session_id.pop(session_cookie, None)
         user_session[0].remove()
         return True
@@ -29,10 +29,11 @@ class SessionExpAuth(SessionAuth):
         session_id = super().create_session(user_id)
         if session_id is None:
             return None
-        self.user_id_by_session_id[session_id] = {
+        # Expired sessions are deleted from the store, not only refused
+        self.user_id_by_session_id.set(session_id, {
             'user_id': user_id,
             'created_at': datetime.now()
-        }
+        }, self.session_duration if self.session_duration > 0 else None)
         return session_id
 
     def user_id_for_session_id(self, session_id=None):
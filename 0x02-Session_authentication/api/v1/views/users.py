@@ -1,18 +1,48 @@
 #!/usr/bin/env python3
 """ Module of Users views
 """
+import json
+
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, jsonify, request
 from models.user import User
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: maximum number of users returned
+      - after: ID of the last user of the previous page
+      - format: `ndjson` to stream one JSON user per line
+    Users are ordered by ID when paginated or streamed
     Return:
       - list of all User objects JSON represented
+      - 400 if limit is not a positive integer
     """
-    all_users = [user.to_json() for user in User.all()]
+    after = request.args.get('after')
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            return jsonify({'error': "limit must be a positive integer"}), 400
+
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            users = User.iterate(after, min(limit or 1000, 1000))
+            for count, user in enumerate(users):
+                if limit is not None and count >= limit:
+                    return
+                yield json.dumps(user.to_json()) + "\n"
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    if limit is None and after is None:
+        all_users = [user.to_json() for user in User.all()]
+    else:
+        all_users = [user.to_json() for user in User.page(after, limit)]
     return jsonify(all_users)
 
 
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+""" Benchmarks of the models and the authentication layer
+
+Usage:
+    ./benchmark.py [-k NAME] [-n USERS]
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import tempfile
+import time
+import timeit
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterator, Sequence
+
+from api.v1.auth.auth import Auth
+from api.v1.auth.basic_auth import BasicAuth
+from api.v1.auth.session_exp_auth import SessionExpAuth
+import models.base
+from models.base import (DATA, TIMESTAMP_FORMAT, LazyObjects,
+                         parse_timestamp, set_backend)
+from models.sqlite_storage import SQLiteStorage
+from models.user import User
+from models.user_session import UserSession
+
+
+def write_users(count: int) -> None:
+    """ Write a .db_User.json file of `count` users in the current directory
+    """
+    objs_json = {}
+    for i in range(count):
+        obj_id = str(uuid.uuid4())
+        objs_json[obj_id] = {
+            "id": obj_id,
+            "created_at": "2023-06-01T22:31:34",
+            "updated_at": "2023-06-01T22:31:34",
+            "email": "user{}@hbtn.io".format(i),
+            "_password": "a5c904771b8617de27d3511d1f538094"
+                         "e26c120da663363b3f760f7b894f9d69",
+            "first_name": "First{}".format(i),
+            "last_name": None,
+        }
+    with open(".db_User.json", 'w') as f:
+        json.dump(objs_json, f)
+
+
+@contextmanager
+def private_directory() -> Iterator[str]:
+    """ Run the block in a new temporary directory, leaving the files of
+    the other benchmarks untouched
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(cwd)
+
+
+def report(name: str, func: Callable[[], object], number: int) -> float:
+    """ Time `number` calls of `func` and print the mean latency in us
+    """
+    seconds = timeit.timeit(func, number=number) / number
+    print("{:<45} {:>12.2f} us".format(name, seconds * 1e6))
+    return seconds
+
+
+def bench_search(count: int) -> None:
+    """ Indexed email lookup against a full scan of every user
+    """
+    email = "user{}@hbtn.io".format(count - 1)
+    indexed = report("search email (indexed), {} users".format(count),
+                     lambda: User.search({'email': email}), 1000)
+    scanned = report("search email (full scan), {} users".format(count),
+                     lambda: [u for u in DATA['User'].values()
+                              if u.email == email], 5)
+    print("{:<45} {:>12.0f}x".format("speedup", scanned / indexed))
+
+
+def bench_load(count: int) -> None:
+    """ Lazy load_from_file, then the cost of building every object
+    """
+    start = time.perf_counter()
+    User.load_from_file()
+    print("{:<45} {:>12.2f} ms".format(
+        "load_from_file (lazy), {} users".format(count),
+        (time.perf_counter() - start) * 1e3))
+    start = time.perf_counter()
+    User.all()
+    print("{:<45} {:>12.2f} ms".format(
+        "build every object, {} users".format(count),
+        (time.perf_counter() - start) * 1e3))
+
+    tracemalloc.start()
+    User.load_from_file()
+    lazy, peak = tracemalloc.get_traced_memory()
+    User.all()
+    built = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("{:<45} {:>12.0f} B".format(
+        "memory per untouched user", lazy / count))
+    print("{:<45} {:>12.0f} B".format(
+        "peak memory of load_from_file, per user", peak / count))
+    print("{:<45} {:>12.0f} B".format(
+        "memory per built user", built / count))
+
+    value = "2023-06-01T22:31:34"
+    report("datetime.strptime",
+           lambda: datetime.strptime(value, TIMESTAMP_FORMAT),
+           100000)
+    report("parse_timestamp", lambda: parse_timestamp(value), 100000)
+    User.load_from_file()
+
+
+def bench_memory(count: int) -> None:
+    """ Bytes per built User and UserSession instance
+    """
+    for cls, kwargs in ((User, {"email": "bob@hbtn.io",
+                                "_password": "a5c904771b8617de",
+                                "first_name": "Bob"}),
+                        (UserSession, {"user_id": str(uuid.uuid4()),
+                                       "session_id": str(uuid.uuid4())})):
+        tracemalloc.start()
+        objs = [cls(created_at="2023-06-01T22:31:34",
+                    updated_at="2023-06-01T22:31:34", **kwargs)
+                for _ in range(count)]
+        size = tracemalloc.get_traced_memory()[0]
+        print("{:<45} {:>12.0f} B".format(
+            "memory per {} object".format(cls.__name__), size / len(objs)))
+        # Saved aside, leaving the objects and file of other benchmarks
+        saved = LazyObjects(cls)
+        for obj in objs:
+            dict.__setitem__(saved, obj.id, obj)
+        previous, DATA[cls.__name__] = DATA.get(cls.__name__), saved
+        with private_directory():
+            try:
+                cls.save_to_file()
+            finally:
+                if previous is None:
+                    del DATA[cls.__name__]
+                else:
+                    DATA[cls.__name__] = previous
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("{:<45} {:>12.0f} B".format(
+            "memory per {} after save_to_file".format(cls.__name__),
+            size / len(objs)))
+
+
+def bench_to_json(count: int) -> None:
+    """ Listing every unchanged user, as GET /api/v1/users does
+    """
+    users = User.all()
+    for run in ("cold", "warm"):
+        start = time.perf_counter()
+        [user.to_json() for user in users]
+        print("{:<45} {:>12.2f} ms".format(
+            "to_json of {} users ({})".format(count, run),
+            (time.perf_counter() - start) * 1e3))
+    start = time.perf_counter()
+    User.save_to_file()
+    print("{:<45} {:>12.2f} ms".format(
+        "save_to_file of {} users (warm)".format(count),
+        (time.perf_counter() - start) * 1e3))
+
+
+def bench_sqlite(count: int) -> None:
+    """ The same users in the SQLite backend
+    """
+    users = User.all()
+    set_backend(SQLiteStorage("bench.sqlite3"))
+    try:
+        start = time.perf_counter()
+        for user in users:
+            user.save()
+        print("{:<45} {:>12.2f} ms".format(
+            "sqlite save of {} users".format(count),
+            (time.perf_counter() - start) * 1e3))
+        email = "user{}@hbtn.io".format(count - 1)
+        report("sqlite search email (indexed), {} users".format(count),
+               lambda: User.search({'email': email}), 1000)
+        report("sqlite get by id, {} users".format(count),
+               lambda: User.get(users[-1].id), 1000)
+        report("sqlite save (update), {} users".format(count),
+               users[-1].save, 1000)
+        report("sqlite page of 100, {} users".format(count),
+               lambda: User.page(users[0].id, 100), 100)
+    finally:
+        set_backend(None)
+
+
+def bench_journal(count: int) -> None:
+    """ UserSession save and remove in journal mode, among `count` saved
+    sessions: the indexes are updated in place
+    """
+    storage, models.base.STORAGE = models.base.STORAGE, 'journal'
+    try:
+        with private_directory():
+            objs_json = {}
+            for _ in range(count):
+                session = UserSession(user_id=str(uuid.uuid4()),
+                                      session_id=str(uuid.uuid4()))
+                objs_json[session.id] = session.to_json()
+            with open(".db_UserSession.json", 'w') as f:
+                json.dump(objs_json, f)
+            del objs_json
+            UserSession.load_from_file()
+            for paged in ("", " (paginated)"):
+                if paged:
+                    # Keeps sorted IDs to update from now on
+                    UserSession.page(None, 1)
+                sessions = [UserSession(user_id=str(uuid.uuid4()),
+                                        session_id=str(uuid.uuid4()))
+                            for _ in range(1000)]
+                saves = iter(sessions)
+                report("journal save, {} sessions{}".format(count, paged),
+                       lambda: next(saves).save(), len(sessions))
+                removals = iter(sessions)
+                report("journal remove, {} sessions{}".format(count, paged),
+                       lambda: next(removals).remove(), len(sessions))
+    finally:
+        models.base.STORAGE = storage
+        UserSession.load_from_file()
+
+
+def bench_reload(count: int) -> None:
+    """ Session lookup as SessionDBAuth does it: full reload on every
+    request against a reload only when the file changed
+    """
+    sessions = [UserSession(user_id=str(uuid.uuid4()),
+                            session_id=str(uuid.uuid4()))
+                for _ in range(count)]
+    UserSession.load_from_file()
+    for session in sessions:
+        DATA['UserSession'][session.id] = session
+    UserSession.save_to_file()
+    UserSession.load_from_file()
+    session_id = sessions[-1].session_id
+
+    def lookup(reload):
+        reload()
+        return UserSession.search({'session_id': session_id})
+
+    report("lookup with load_from_file, {} sessions".format(count),
+           lambda: lookup(UserSession.load_from_file), 5)
+    report("lookup with reload_if_changed, {} sessions".format(count),
+           lambda: lookup(UserSession.reload_if_changed), 1000)
+
+
+def require_auth_per_pattern(path: str, exclude_paths: list) -> bool:
+    """ Auth.require_auth as it was: one regex compiled per exclude path
+    and request
+    """
+    path = path + '/' if path[-1] != '/' else path
+    for exclude_path in exclude_paths:
+        exclude_path = exclude_path.replace('/', '\\/').replace('*', '.*')
+        if re.compile(exclude_path).search(path):
+            return False
+    return True
+
+
+def bench_require_auth(count: int) -> None:
+    """ Auth.require_auth with 1,000 exclude paths, half of them with a
+    wildcard
+    """
+    exclude_paths = tuple("/api/v1/resource{}/{}".format(
+        i, "*" if i % 2 else "") for i in range(1000))
+    auth = Auth()
+    for path in ("/api/v1/users/", "/api/v1/resource999/a", "/api/v1/"
+                 "resource0/"):
+        assert auth.require_auth(path, exclude_paths) == \
+            require_auth_per_pattern(path, exclude_paths)
+        report("require_auth per pattern, {}".format(path),
+               lambda p=path: require_auth_per_pattern(p, exclude_paths), 20)
+        report("require_auth merged, {}".format(path),
+               lambda p=path: auth.require_auth(p, exclude_paths), 10000)
+
+
+class FakeRequest:
+    """ The headers of a request, as the auth classes read them
+    """
+
+    def __init__(self, authorization: str):
+        """ Initialize a request with an Authorization header
+        """
+        self.headers = {'Authorization': authorization}
+
+
+def basic_request(email: str, password: str) -> FakeRequest:
+    """ Build a request with Basic credentials
+    """
+    credentials = "{}:{}".format(email, password).encode()
+    return FakeRequest("Basic " + base64.b64encode(credentials).decode())
+
+
+def bench_basic_auth(count: int) -> None:
+    """ BasicAuth.current_user for a client repeating the same header
+    """
+    user = User.all()[-1]
+    user.password = "pwd"
+    user.save()
+    request = basic_request(user.email, "pwd")
+    uncached = BasicAuth()
+    uncached.credential_cache.size = 0
+    report("BasicAuth.current_user (no cache)",
+           lambda: uncached.current_user(request), 10000)
+    cached = BasicAuth()
+    report("BasicAuth.current_user (cached)",
+           lambda: cached.current_user(request), 10000)
+    print("{:<45} {:>12}".format("credential cache",
+                                 str(cached.credential_cache.stats())))
+
+    wrong = basic_request(user.email, "wrong")
+    unthrottled = BasicAuth()
+    unthrottled.failure_cache.size = 0
+    unthrottled.email_throttle.size = 0
+    report("BasicAuth wrong password (no cache)",
+           lambda: unthrottled.current_user(wrong), 10000)
+    wrong.remote_addr = "192.0.2.1"
+    report("BasicAuth wrong password (throttled)",
+           lambda: cached.current_user(wrong), 10000)
+    print("{:<45} {:>12}".format("throttles", str(cached.throttle_stats())))
+
+
+def bench_sessions(count: int) -> None:
+    """ SessionExpAuth logins with a 1 s lifetime: memory stays bounded by
+    the live sessions
+    """
+    auth = SessionExpAuth()
+    auth.session_duration = 1
+    store = auth.user_id_by_session_id
+    for _ in range(2):
+        start = time.perf_counter()
+        for _ in range(count):
+            auth.create_session("user")
+        print("{:<45} {:>12.2f} us".format(
+            "create_session", (time.perf_counter() - start) / count * 1e6))
+        print("{:<45} {:>12}".format("sessions", str(store.stats())))
+        time.sleep(1.1)
+    store.sweep()
+    print("{:<45} {:>12}".format("sessions after 1 s", str(store.stats())))
+
+
+BENCHMARKS = {
+    "load": bench_load,
+    "search": bench_search,
+    "memory": bench_memory,
+    "to_json": bench_to_json,
+    "sqlite": bench_sqlite,
+    "journal": bench_journal,
+    "reload": bench_reload,
+    "require_auth": bench_require_auth,
+    "basic_auth": bench_basic_auth,
+    "sessions": bench_sessions,
+}
+
+
+def main(argv: Sequence[str] = None) -> None:
+    """ Run the benchmarks in a temporary directory
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="pattern", default="",
+                        help="only run benchmarks whose name contains this")
+    parser.add_argument("-n", dest="count", type=int, default=100000,
+                        help="number of users (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            write_users(args.count)
+            User.load_from_file()
+            for name, bench in BENCHMARKS.items():
+                if args.pattern in name:
+                    bench(args.count)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,424 @@
 #!/usr/bin/env python3
 """ Base module
 """
+import atexit
+import fcntl
 import json
+import logging
+import os
+import re
+import threading
+import time
 import uuid
+import zlib
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
 from datetime import datetime
-from os import path
-from typing import Iterable, List, TypeVar
+from functools import lru_cache
+from os import getenv, path
+from typing import Iterable, Iterator, List, Tuple, TypeVar
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+INDEXES = {}
+# Sorted IDs of each class: the stable order used to paginate
+ORDERED_IDS = {}
+
+# Concurrency: writers (save, remove, load_from_file, save_to_file and
+# indexed attribute changes) hold the lock of their class, one at a time,
+# and update the indexes in place. Readers never take it: they copy an
+# index bucket in one C call, read the objects of a class as an atomic
+# snapshot of DATA[s_class], and slice the sorted IDs under
+# _ordered_ids_lock, which writers hold only while inserting or deleting
+_class_locks = {}
+_class_locks_guard = threading.Lock()
+_ordered_ids_lock = threading.Lock()
+
+# What this process last read or wrote of the files of each class:
+# {'snapshot': file_signature of the JSON file, 'journal': (inode, offset)
+# of the end of the last journal record seen, or None}
+FILE_STATES = {}
+
+# 'json' rewrites .db_<Class>.json on every write; 'journal' appends one
+# record per write to .db_<Class>.journal and compacts it into the JSON
+# snapshot once it grows past MODELS_JOURNAL_MAX_BYTES; 'sqlite' keeps the
+# objects in a database shared by every process (see StorageBackend)
+STORAGE = getenv('MODELS_STORAGE', 'json')
+JOURNAL_MAX_BYTES = int(getenv('MODELS_JOURNAL_MAX_BYTES', str(4 << 20)))
+FSYNC = getenv('MODELS_FSYNC', '0') == '1'
+_UNSET = object()
+
+# Write-behind: in 'json' mode, writes only mark their class dirty and a
+# background thread saves it at most MODELS_FLUSH_INTERVAL seconds later
+# (the maximum durability lag), or as soon as MODELS_FLUSH_EVERY changes
+# are pending
+WRITE_BEHIND = getenv('MODELS_WRITE_BEHIND', '0') == '1'
+FLUSH_INTERVAL = float(getenv('MODELS_FLUSH_INTERVAL', '1'))
+FLUSH_EVERY = int(getenv('MODELS_FLUSH_EVERY', '100'))
+DIRTY = {}
+_flush_condition = threading.Condition()
+_flusher = None
+
+
+def flush(s_class: str = None):
+    """ Save every dirty class (or only `s_class`) to its file now
+    A class stays dirty until its save succeeds; the first error is
+    raised once every class was tried
+    """
+    with _flush_condition:
+        names = list(DIRTY) if s_class is None else \
+            [s_class] if s_class in DIRTY else []
+    error = None
+    for name in names:
+        # Under the class lock, no change can be made (or reloaded away
+        # by load_from_file) between taking the dirty mark and saving
+        with class_lock(name):
+            with _flush_condition:
+                entry = DIRTY.pop(name, None)
+            if entry is None:
+                continue
+            cls, pending = entry
+            try:
+                cls.save_to_file()
+            except Exception as e:
+                with _flush_condition:
+                    DIRTY[name] = (cls, DIRTY.get(name, (cls, 0))[1] +
+                                   pending)
+                error = error or e
+    if error is not None:
+        raise error
+
+
+def _mark_dirty(cls):
+    """ Record a pending change of `cls`, to be saved by the flusher
+    """
+    global _flusher
+    with _flush_condition:
+        pending = DIRTY.get(cls.__name__, (cls, 0))[1] + 1
+        DIRTY[cls.__name__] = (cls, pending)
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop,
+                                        name="models-flusher", daemon=True)
+            _flusher.start()
+        if pending >= FLUSH_EVERY:
+            _flush_condition.notify()
+
+
+def _flush_loop():
+    """ Flusher thread: coalesce the pending changes into one file write
+    per class every FLUSH_INTERVAL seconds or FLUSH_EVERY changes
+    """
+    while True:
+        with _flush_condition:
+            _flush_condition.wait_for(
+                lambda: any(pending >= FLUSH_EVERY
+                            for _, pending in DIRTY.values()),
+                timeout=FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            # The classes stay dirty: retry after the interval
+            logging.getLogger(__name__).exception(
+                "write-behind flush failed, retrying in %s s",
+                FLUSH_INTERVAL)
+            time.sleep(FLUSH_INTERVAL)
+
+
+atexit.register(flush)
+
+
+def class_lock(s_class: str) -> threading.RLock:
+    """ Return the lock serializing the writers of the class `s_class`
+    """
+    lock = _class_locks.get(s_class)
+    if lock is None:
+        with _class_locks_guard:
+            lock = _class_locks.setdefault(s_class, threading.RLock())
+    return lock
+
+
+def file_signature(file_path: str) -> tuple:
+    """ Return the (inode, size, mtime) of a file, or None if missing
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+@contextmanager
+def file_lock(lock_path: str):
+    """ Hold an exclusive lock shared by every process on `lock_path`
+    """
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+_JSON_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def scan_objects(text: str) -> Iterator[tuple]:
+    """ Yield the (ID, JSON dictionary, raw JSON text) of every object of
+    a JSON snapshot, one at a time
+    Unlike json.load, only one parsed object is held at once
+    """
+    end = _WHITESPACE.match(text, 0).end()
+    if text[end:end + 1] != '{':
+        raise ValueError("expected a JSON object")
+    end = _WHITESPACE.match(text, end + 1).end()
+    if text[end:end + 1] == '}':
+        return
+    while True:
+        obj_id, end = _JSON_DECODER.raw_decode(text, end)
+        end = _WHITESPACE.match(text, end).end()
+        if text[end:end + 1] != ':':
+            raise ValueError("expected ':' at {}".format(end))
+        start = _WHITESPACE.match(text, end + 1).end()
+        obj_json, end = _JSON_DECODER.raw_decode(text, start)
+        yield obj_id, obj_json, text[start:end]
+        end = _WHITESPACE.match(text, end).end()
+        if text[end:end + 1] == '}':
+            return
+        if text[end:end + 1] != ',':
+            raise ValueError("expected ',' at {}".format(end))
+        end = _WHITESPACE.match(text, end + 1).end()
+
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string, with a fast path for the ISO
+    form written by `to_json`
+    Objects stamped in the same second share one (immutable) datetime
+    """
+    if len(value) == 19 and value[10] == 'T':
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class StorageBackend():
+    """ Interface of a storage backend replacing DATA and the JSON files
+    Every method receives the model class (or object) it works on; the
+    objects returned are built with `cls(**attributes)`
+    """
+
+    def load(self, cls):
+        """ Prepare the storage of `cls` (Base.load_from_file)
+        """
+        raise NotImplementedError()
+
+    def save_all(self, cls):
+        """ Persist every pending change of `cls` (Base.save_to_file)
+        """
+        raise NotImplementedError()
+
+    def save(self, obj):
+        """ Insert or update one object
+        """
+        raise NotImplementedError()
+
+    def remove(self, obj):
+        """ Delete one object, if stored
+        """
+        raise NotImplementedError()
+
+    def count(self, cls) -> int:
+        """ Count the objects of `cls`
+        """
+        raise NotImplementedError()
+
+    def get(self, cls, id: str):
+        """ Return one object of `cls` by ID, or None
+        """
+        raise NotImplementedError()
+
+    def search(self, cls, attributes: dict) -> list:
+        """ Return the objects of `cls` with matching attributes, in
+        insertion order
+        """
+        raise NotImplementedError()
+
+    def page(self, cls, after: str, limit: int) -> list:
+        """ Return up to `limit` objects of `cls` ordered by ID, starting
+        after the ID `after`
+        """
+        raise NotImplementedError()
+
+
+# The backend every model uses instead of DATA, or None for the JSON files
+BACKEND = None
+
+
+def set_backend(backend: StorageBackend):
+    """ Use `backend` for every model (None: back to DATA and JSON files)
+    """
+    global BACKEND
+    BACKEND = backend
+
+
+class LazyObjects(dict):
+    """ Objects of a class by ID, kept in their loaded JSON form until
+    first accessed
+    Untouched snapshot records are stored as their raw JSON bytes, a
+    single object smaller than the built instance; journal records keep
+    their dictionary
+    """
+
+    def __init__(self, cls):
+        """ Initialize an empty mapping building `cls` instances
+        """
+        super().__init__()
+        self.cls = cls
+        self._hydrate_lock = threading.Lock()
+
+    def set_json(self, obj_id: str, obj_json: dict):
+        """ Store the JSON dictionary of an object, to be built on access
+        """
+        dict.__setitem__(self, obj_id, obj_json)
+
+    def set_raw(self, obj_id: str, raw: bytes):
+        """ Store the raw JSON text of an object, to be built on access
+        """
+        dict.__setitem__(self, obj_id, raw)
+
+    def json_of(self, value) -> dict:
+        """ Return the JSON dictionary of a stored value, or None if the
+        value is an already built object
+        """
+        if type(value) is bytes:
+            return json.loads(value)
+        if type(value) is dict:
+            return value
+        return None
+
+    def raw_of(self, value) -> str:
+        """ Return the JSON text of a stored value, or None if the value
+        is an already built object
+        """
+        if type(value) is bytes:
+            return value.decode()
+        if type(value) is dict:
+            return json.dumps(value)
+        return None
+
+    def _hydrate(self, obj_id: str, value):
+        """ Build the object of a stored JSON form and keep it
+        Concurrent readers of the same record get the same object
+        """
+        obj_json = self.json_of(value)
+        if obj_json is None:
+            return value
+        with self._hydrate_lock:
+            current = dict.get(self, obj_id, _UNSET)
+            if current is value or current is _UNSET:
+                obj = self.cls(**obj_json)
+                if current is value:
+                    dict.__setitem__(self, obj_id, obj)
+                return obj
+        # Built or replaced by another thread meanwhile
+        return self._hydrate(obj_id, current)
+
+    def __getitem__(self, obj_id: str):
+        """ Return the object, building it on first access
+        """
+        return self._hydrate(obj_id, dict.__getitem__(self, obj_id))
+
+    def get(self, obj_id: str, default=None):
+        """ Return the object, building it on first access
+        """
+        value = dict.get(self, obj_id, _UNSET)
+        if value is _UNSET:
+            return default
+        return self._hydrate(obj_id, value)
+
+    def values(self) -> list:
+        """ Return every object, building the ones not accessed yet
+        """
+        return [self._hydrate(k, v) for k, v in list(dict.items(self))]
+
+    def items(self) -> list:
+        """ Return every (ID, object) pair, building the objects
+        """
+        return [(k, self._hydrate(k, v)) for k, v in list(dict.items(self))]
 
 
 class Base():
     """ Base class
+    Subclasses declare their attributes in `__slots__`: instances have no
+    per-object __dict__, which keeps millions of them small
     """
+    __slots__ = ('id', 'created_at', 'updated_at', '_json_cache')
+    # Attributes kept in a hash index: `search` answers equality queries
+    # on them without scanning every object
+    INDEXED_ATTRIBUTES = ()
+
+    @classmethod
+    def _attributes(cls) -> tuple:
+        """ Return the slot attributes of the class, base class first
+        """
+        attributes = cls.__dict__.get('_slot_attributes')
+        if attributes is None:
+            attributes = tuple(
+                name for klass in reversed(cls.__mro__)
+                for name in klass.__dict__.get('__slots__', ())
+                if name != '_json_cache')
+            cls._slot_attributes = attributes
+        return attributes
+
+    def _items(self) -> Iterable[tuple]:
+        """ Yield the (name, value) pair of every attribute that is set
+        """
+        for key in self._attributes():
+            value = getattr(self, key, _UNSET)
+            if value is not _UNSET:
+                yield key, value
+        yield from getattr(self, '__dict__', {}).items()
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+            DATA.setdefault(s_class, LazyObjects(self.__class__))
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
             self.updated_at = datetime.utcnow()
 
+    def __setattr__(self, name: str, value) -> None:
+        """ Set an attribute, keeping the indexes of saved objects in sync
+        and dropping the memoized JSON form
+        """
+        object.__setattr__(self, '_json_cache', None)
+        if name in self.INDEXED_ATTRIBUTES and self._registered():
+            with class_lock(self.__class__.__name__):
+                if self._registered():
+                    self.__class__._index_remove(self, name)
+                    object.__setattr__(self, name, value)
+                    self.__class__._index_add(self, name, reorder=True)
+                    return
+        object.__setattr__(self, name, value)
+
+    def _registered(self) -> bool:
+        """ Tell whether this very object is the saved one in DATA
+        """
+        objs = DATA.get(self.__class__.__name__, {})
+        return dict.get(objs, getattr(self, "id", None)) is self
+
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
         """
@@ -46,64 +431,377 @@ class Base():
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
-        result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
-                continue
-            if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
-            else:
-                result[key] = value
+        serialized = self._serialized()
+        if for_serialization:
+            return dict(serialized)
+        return {key: value for key, value in serialized.items()
+                if key[0] != '_'}
+
+    def _serialized(self, cache: bool = True) -> dict:
+        """ Return the memoized JSON dictionary of every attribute
+        The cache is dropped whenever an attribute is set; callers must
+        not modify the returned dictionary. With `cache` False, a missing
+        dictionary is built without being kept (for one-off writes)
+        """
+        result = getattr(self, '_json_cache', None)
+        if result is None:
+            result = {}
+            for key, value in self._items():
+                if type(value) is datetime:
+                    result[key] = value.strftime(TIMESTAMP_FORMAT)
+                else:
+                    result[key] = value
+            if cache:
+                object.__setattr__(self, '_json_cache', result)
         return result
 
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from file: the JSON snapshot, then the
+        journal records written since it
+        Objects are built on first access (see LazyObjects). The new
+        objects and indexes are built aside, then replace the old ones
         """
+        if BACKEND is not None:
+            return BACKEND.load(cls)
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        with class_lock(s_class):
+            # Pending write-behind changes are saved before the file is
+            # read, with no change possible in between
+            flush(s_class)
+            snapshot = file_signature(file_path)
+            objs = LazyObjects(cls)
+            # Indexed values of the raw records, read while they are parsed
+            indexed = {}
+            if path.exists(file_path):
+                with open(file_path, 'r') as f:
+                    text = f.read()
+                for obj_id, obj_json, raw in scan_objects(text):
+                    objs.set_raw(obj_id, raw.encode())
+                    indexed[obj_id] = tuple(
+                        obj_json.get(name) for name in cls.INDEXED_ATTRIBUTES)
+                del text
+            journal = cls._replay_journal(objs)
+            cls._reindex(objs, indexed)
+            FILE_STATES[s_class] = {'snapshot': snapshot, 'journal': journal}
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def reload_if_changed(cls) -> bool:
+        """ Reload the objects only if their files changed since this
+        process last read or wrote them (e.g. written by another worker)
+        Records appended to the journal meanwhile are applied one by one
+        to the loaded objects; any other change reloads everything
+        Returns:
+            True if anything was reloaded
+        """
+        if BACKEND is not None:
+            BACKEND.load(cls)
+            return False
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        journal_path = ".db_{}.journal".format(s_class)
+        state = FILE_STATES.get(s_class)
+        if state is not None and \
+                state['snapshot'] == file_signature(file_path):
+            journal = state['journal']
+            signature = file_signature(journal_path)
+            if journal is None and signature is None or \
+                    journal is not None and signature is not None and \
+                    signature[:2] == journal:
+                return False
+        with class_lock(s_class):
+            state = FILE_STATES.get(s_class)
+            if state is None or \
+                    state['snapshot'] != file_signature(file_path):
+                cls.load_from_file()
+                return True
+            inode, offset = state['journal'] or (None, 0)
+            journal = cls._read_journal(offset)
+            if journal is None:
+                if inode is None:
+                    return False
+                cls.load_from_file()
+                return True
+            if inode is not None and journal[0] != inode or \
+                    journal[2] < offset:
+                cls.load_from_file()
+                return True
+            for record in journal[3]:
+                cls._apply_record(record)
+            state['journal'] = journal[:2]
+            return len(journal[3]) > 0
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
+        The snapshot is written to a temporary file of this process, then
+        replaces the file atomically and supersedes the journal. Journal
+        records of other workers are applied first: the journal is moved
+        aside and read to its end, and records appended meanwhile go to
+        a new journal, replayed on top of the snapshot. Workers save one
+        at a time (.db_<Class>.lock), each on top of the previous one
         """
+        if BACKEND is not None:
+            return BACKEND.save_all(cls)
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        journal_path = ".db_{}.journal".format(s_class)
+        with class_lock(s_class), file_lock(".db_{}.lock".format(s_class)):
+            if STORAGE == 'journal':
+                # Every change is already in the files: nothing is lost
+                # if another worker's snapshot has to be reloaded
+                cls.reload_if_changed()
+            aside = cls._move_journal_aside()
+            try:
+                cls._write_snapshot(file_path)
+            except BaseException:
+                if aside is not None:
+                    try:
+                        # Put the journal back, unless a new one exists
+                        os.link(aside.name, journal_path)
+                    except FileExistsError:
+                        pass
+                raise
+            finally:
+                if aside is not None:
+                    os.remove(aside.name)
+                    aside.close()
+            FILE_STATES[s_class] = {'snapshot': file_signature(file_path),
+                                    'journal': None}
+
+    @classmethod
+    def _move_journal_aside(cls):
+        """ Rename the journal aside and apply the records of it this
+        process has not seen yet
+        Returns:
+            The journal moved aside, open and locked until it is closed,
+            or None if there is no journal
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        aside_path = "{}.{}".format(journal_path, os.getpid())
+        try:
+            os.rename(journal_path, aside_path)
+        except FileNotFoundError:
+            return None
+        aside = open(aside_path, 'rb')
+        # Wait for the appends in progress (see _append_journal)
+        fcntl.flock(aside.fileno(), fcntl.LOCK_EX)
+        state = FILE_STATES.get(s_class) or {}
+        inode, offset = state.get('journal') or (None, 0)
+        if os.fstat(aside.fileno()).st_ino != inode:
+            offset = 0
+        for record in cls._read_journal(offset, aside_path)[3]:
+            cls._apply_record(record)
+        return aside
+
+    @classmethod
+    def _write_snapshot(cls, file_path: str):
+        """ Write every object to `file_path` atomically
+        """
+        objs = DATA[cls.__name__]
+
+        def _parts():
+            """ The JSON text of the snapshot, object by object
+            """
+            separator = ""
+            for obj_id, obj in list(dict.items(objs)):
+                # Objects never accessed since loading are still JSON
+                raw = objs.raw_of(obj)
+                if raw is None:
+                    raw = json.dumps(obj._serialized(cache=False))
+                yield '{}{}: {}'.format(separator, json.dumps(obj_id), raw)
+                separator = ", "
+
+        # One temporary file per process: workers saving at the same time
+        # never write into each other's snapshot
+        tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write("{")
+                f.writelines(_parts())
+                f.write("}")
+                if FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def compact(cls):
+        """ Fold the journal, with the records other workers appended
+        since this process last read it, into the JSON snapshot
+        """
+        cls.save_to_file()
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def _write(cls, obj: TypeVar('Base'), removed: bool = False):
+        """ Persist the save or removal of `obj`: append it to the journal,
+        mark the class dirty for the flusher, or rewrite the file
+        """
+        if STORAGE == 'journal':
+            cls._append_journal({'op': 'remove', 'id': obj.id} if removed
+                                else {'op': 'save',
+                                      'obj': obj._serialized(cache=False)})
+        elif WRITE_BEHIND:
+            _mark_dirty(cls)
+        else:
+            cls.save_to_file()
+
+    @classmethod
+    def _append_journal(cls, record: dict):
+        """ Append one record to the journal, compacting it when too big
+        Each line is `<crc32> <json>`: a torn or corrupted tail is
+        detected and dropped on load
+        """
+        payload = json.dumps(record).encode()
+        line = b"%08x %s\n" % (zlib.crc32(payload), payload)
+        journal_path = ".db_{}.journal".format(cls.__name__)
+        while True:
+            f = open(journal_path, 'ab')
+            # A compaction moving the journal aside waits for this lock;
+            # retry if it moved the file before the lock was taken
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+            signature = file_signature(journal_path)
+            if signature is not None and \
+                    signature[0] == os.fstat(f.fileno()).st_ino:
+                break
+            f.close()
+        with f:
+            f.write(line)
+            f.flush()
+            if FSYNC:
+                os.fsync(f.fileno())
+            # Where the record really landed: other workers may have
+            # appended since the file was opened
+            size = f.tell()
+            start = size - len(line)
+            inode = os.fstat(f.fileno()).st_ino
+        state = FILE_STATES.get(cls.__name__)
+        # Only skip our own record if nobody else appended since we read
+        if state is not None and \
+                (state['journal'] or (inode, 0)) == (inode, start):
+            state['journal'] = (inode, size)
+        if size > JOURNAL_MAX_BYTES:
+            cls.compact()
+
+    @classmethod
+    def _read_journal(cls, offset: int = 0,
+                      journal_path: str = None) -> Tuple[int, int, int, list]:
+        """ Read the valid journal records from the byte `offset` on
+        (of the journal of the class, or of `journal_path`)
+        Returns:
+            (inode, end offset of the last valid record, file size,
+            records), or None if there is no journal
+        """
+        if journal_path is None:
+            journal_path = ".db_{}.journal".format(cls.__name__)
+        try:
+            f = open(journal_path, 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            f.seek(offset)
+            valid_size = offset
+            records = []
+            for line in f:
+                try:
+                    checksum, payload = line.rstrip(b"\n").split(b" ", 1)
+                    if not line.endswith(b"\n") or \
+                            int(checksum, 16) != zlib.crc32(payload):
+                        break
+                    records.append(json.loads(payload))
+                except ValueError:
+                    break
+                valid_size += len(line)
+            st = os.fstat(f.fileno())
+        return (st.st_ino, valid_size, st.st_size, records)
+
+    @classmethod
+    def _replay_journal(cls, objs: LazyObjects) -> Tuple[int, int]:
+        """ Apply the journal records on top of the loaded snapshot
+        Records are idempotent (full object or removal), so replaying a
+        journal already folded into the snapshot is harmless
+        Returns:
+            The (inode, offset) of the end of the journal, or None
+        """
+        journal = cls._read_journal()
+        if journal is None:
+            return None
+        inode, valid_size, size, records = journal
+        for record in records:
+            if record['op'] == 'save':
+                obj_json = record['obj']
+                objs.set_json(obj_json['id'], obj_json)
+            else:
+                objs.pop(record['id'], None)
+        if valid_size < size:
+            with open(".db_{}.journal".format(cls.__name__), 'r+b') as f:
+                # The tail may be a record being appended: once no append
+                # is in progress, drop it only if it is still invalid
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                tail = cls._read_journal(valid_size)
+                if tail is not None and tail[0] == inode and \
+                        tail[1] == valid_size:
+                    f.truncate(valid_size)
+        return (inode, valid_size)
+
+    @classmethod
+    def _apply_record(cls, record: dict):
+        """ Apply one journal record to the loaded objects and indexes
+        """
+        objs = DATA[cls.__name__]
+        save = record['op'] == 'save'
+        obj_id = record['obj']['id'] if save else record['id']
+        previous = objs.get(obj_id)
+        if previous is not None:
+            cls._index_remove(previous)
+        if save:
+            objs.set_json(obj_id, record['obj'])
+            cls._index_add(objs[obj_id], reorder=previous is not None)
+        elif previous is not None:
+            del objs[obj_id]
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        if BACKEND is not None:
+            return BACKEND.save(self)
+        with class_lock(s_class):
+            previous = DATA[s_class].get(self.id)
+            if previous is not self:
+                if previous is not None:
+                    self.__class__._index_remove(previous)
+                DATA[s_class][self.id] = self
+                self.__class__._index_add(self,
+                                          reorder=previous is not None)
+            self.__class__._write(self)
 
     def remove(self):
         """ Remove object
         """
+        if BACKEND is not None:
+            return BACKEND.remove(self)
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        with class_lock(s_class):
+            previous = DATA[s_class].get(self.id)
+            if previous is not None:
+                self.__class__._index_remove(previous)
+                del DATA[s_class][self.id]
+                self.__class__._write(self, removed=True)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
+        if BACKEND is not None:
+            return BACKEND.count(cls)
         s_class = cls.__name__
         return len(DATA[s_class].keys())
 
@@ -113,10 +811,51 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, after: str = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects ordered by ID, starting after the
+        ID `after` (a cursor: the last ID of the previous page)
+        """
+        if BACKEND is not None:
+            return BACKEND.page(cls, after, limit)
+        s_class = cls.__name__
+        objs = DATA[s_class]
+        ids = ORDERED_IDS.get(s_class)
+        if ids is None:
+            # Sorted on the first page only: most classes never need it
+            with class_lock(s_class):
+                objs = DATA[s_class]
+                ids = ORDERED_IDS.get(s_class)
+                if ids is None:
+                    ids = sorted(dict.keys(objs))
+                    ORDERED_IDS[s_class] = ids
+        with _ordered_ids_lock:
+            # The IDs change in place: find and slice the page at once
+            start = 0 if after is None else bisect_right(ids, after)
+            end = len(ids) if limit is None else start + limit
+            page_ids = ids[start:end]
+        return [obj for obj in map(objs.get, page_ids) if obj is not None]
+
+    @classmethod
+    def iterate(cls, after: str = None,
+                batch_size: int = 1000) -> Iterator[TypeVar('Base')]:
+        """ Yield every object ordered by ID, one page at a time, so only
+        `batch_size` objects are held at once
+        """
+        while True:
+            objs = cls.page(after, batch_size)
+            if len(objs) == 0:
+                return
+            yield from objs
+            after = objs[-1].id
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
+        if BACKEND is not None:
+            return BACKEND.get(cls, id)
         s_class = cls.__name__
         return DATA[s_class].get(id)
 
@@ -124,6 +863,8 @@ class Base():
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
+        if BACKEND is not None:
+            return BACKEND.search(cls, attributes)
         s_class = cls.__name__
 
         def _search(obj):
@@ -134,4 +875,109 @@ class Base():
                     return False
             return True
 
+        indexes = INDEXES.get(s_class, {})
+        for k, v in attributes.items():
+            if k not in indexes:
+                continue
+            try:
+                bucket = indexes[k].get(v)
+            except TypeError:
+                continue
+            if bucket is None:
+                return []
+            # Copied at once (see _index_add); an object removed or
+            # changed meanwhile is skipped
+            objs = DATA[s_class]
+            return list(filter(_search, filter(
+                None, map(objs.get, list(bucket)))))
         return list(filter(_search, DATA[s_class].values()))
+
+    @classmethod
+    def _reindex(cls, objs: LazyObjects, indexed: dict = None):
+        """ Build the indexes of `objs`, then publish them with `objs`
+        as the objects of the class
+        Entries still in JSON form are indexed without building them;
+        `indexed` holds the INDEXED_ATTRIBUTES values of raw entries
+        """
+        s_class = cls.__name__
+        indexes = {name: {} for name in cls.INDEXED_ATTRIBUTES}
+        indexed = {} if indexed is None else indexed
+        for position, (attr, index) in enumerate(indexes.items()):
+            for obj_id, obj in dict.items(objs):
+                if type(obj) is bytes and obj_id in indexed:
+                    value = indexed[obj_id][position]
+                elif type(obj) is bytes:
+                    value = objs.json_of(obj).get(attr)
+                elif type(obj) is dict:
+                    value = obj.get(attr)
+                else:
+                    value = getattr(obj, attr, None)
+                try:
+                    index.setdefault(value, {})[obj_id] = None
+                except TypeError:
+                    continue
+        # Sorted again by the next page() call, if any
+        ORDERED_IDS.pop(s_class, None)
+        INDEXES[s_class] = indexes
+        DATA[s_class] = objs
+
+    @classmethod
+    def _index_add(cls, obj: TypeVar('Base'), name: str = None,
+                   reorder: bool = False):
+        """ Add a saved object to the indexes (only `name` if given)
+        A bucket is an ordered set of IDs listed in DATA order, like a
+        full scan; with `reorder`, the object may not be last in DATA
+        The sorted IDs and the buckets are updated in place (see the
+        concurrency note at the top of the module)
+        """
+        s_class = cls.__name__
+        if s_class not in INDEXES:
+            cls._reindex(DATA[s_class])
+            return
+        ids = ORDERED_IDS.get(s_class)
+        if name is None and ids is not None:
+            position = bisect_left(ids, obj.id)
+            if position == len(ids) or ids[position] != obj.id:
+                with _ordered_ids_lock:
+                    ids.insert(position, obj.id)
+        for attr in (name,) if name else cls.INDEXED_ATTRIBUTES:
+            value = getattr(obj, attr, None)
+            index = INDEXES[s_class][attr]
+            try:
+                bucket = index.setdefault(value, {})
+            except TypeError:
+                continue
+            bucket[obj.id] = None
+            if reorder and len(bucket) > 1:
+                index[value] = {obj_id: None
+                                for obj_id in dict.keys(DATA[s_class])
+                                if obj_id in bucket}
+
+    @classmethod
+    def _index_remove(cls, obj: TypeVar('Base'), name: str = None):
+        """ Remove a saved object from the indexes (only `name` if given)
+        """
+        s_class = cls.__name__
+        indexes = INDEXES.get(s_class, {})
+        ids = ORDERED_IDS.get(s_class)
+        if name is None and ids is not None:
+            position = bisect_left(ids, obj.id)
+            if position < len(ids) and ids[position] == obj.id:
+                with _ordered_ids_lock:
+                    del ids[position]
+        for attr in (name,) if name else cls.INDEXED_ATTRIBUTES:
+            value = getattr(obj, attr, None)
+            try:
+                bucket = indexes[attr].get(value)
+            except (KeyError, TypeError):
+                continue
+            if bucket is not None and obj.id in bucket:
+                del bucket[obj.id]
+                if len(bucket) == 0:
+                    del indexes[attr][value]
+
+
+if STORAGE == 'sqlite':
+    from models.sqlite_storage import SQLiteStorage
+    set_backend(SQLiteStorage(getenv('MODELS_SQLITE_PATH',
+                                     '.db_models.sqlite3')))
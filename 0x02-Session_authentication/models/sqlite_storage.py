@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+""" SQLite storage backend module
+"""
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Tuple, TypeVar
+
+from models.base import FSYNC, TIMESTAMP_FORMAT, StorageBackend
+
+# Values stored as they are; other search values are filtered in Python
+SQL_TYPES = (str, int, float, bytes, type(None))
+
+
+class SQLiteStorage(StorageBackend):
+    """ Objects stored in one SQLite database, one table per class
+    The database runs in WAL mode: every process of the API shares it,
+    readers never wait for the writer, and each write is one small
+    transaction instead of a rewrite of the whole file. Every attribute
+    is a column, and INDEXED_ATTRIBUTES get a B-tree index
+    """
+
+    def __init__(self, db_path: str, timeout: float = 5.0):
+        """ Initialize the backend of the database file `db_path`
+        """
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._columns = {}
+        self._statements = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread, opening it on
+        first use
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous={}".format(
+                "FULL" if FSYNC else "NORMAL"))
+            self._local.conn = conn
+        return conn
+
+    def _table(self, cls, extra: Tuple[str, ...] = ()) -> Tuple[str, ...]:
+        """ Create the table and indexes of `cls` if needed, adding the
+        columns it lacks (its attributes, then `extra`)
+        Returns:
+            The columns of the table
+        """
+        s_class = cls.__name__
+        columns = self._columns.get(s_class)
+        if columns is not None and all(name in columns for name in extra):
+            return columns
+        with self._lock:
+            conn = self._connection()
+            conn.execute('CREATE TABLE IF NOT EXISTS "{}" '
+                         '(id TEXT PRIMARY KEY)'.format(s_class))
+            columns = tuple(row[1] for row in conn.execute(
+                'PRAGMA table_info("{}")'.format(s_class)))
+            for name in cls._attributes() + tuple(extra):
+                if name not in columns:
+                    try:
+                        conn.execute('ALTER TABLE "{}" ADD COLUMN "{}"'
+                                     .format(s_class, name))
+                    except sqlite3.OperationalError:
+                        # Added meanwhile by another process
+                        pass
+                    columns += (name,)
+            for name in cls.INDEXED_ATTRIBUTES:
+                conn.execute('CREATE INDEX IF NOT EXISTS "{0}_{1}" '
+                             'ON "{0}" ("{1}")'.format(s_class, name))
+            self._columns[s_class] = columns
+            self._statements = {
+                key: statements for key, statements
+                in self._statements.items() if key[0] != s_class}
+        return columns
+
+    def _build(self, cls, columns: Tuple[str, ...], row: tuple):
+        """ Build an object from a table row
+        """
+        return cls(**{name: value for name, value in zip(columns, row)
+                      if value is not None or name == 'id'})
+
+    def _select(self, cls, where: str = "", params: tuple = (),
+                suffix: str = "ORDER BY rowid") -> List[TypeVar('Base')]:
+        """ Return the objects of the rows matching a WHERE clause
+        """
+        columns = self._table(cls)
+        sql = 'SELECT {} FROM "{}" {} {}'.format(
+            ", ".join('"{}"'.format(name) for name in columns),
+            cls.__name__, where, suffix)
+        rows = self._connection().execute(sql, params).fetchall()
+        return [self._build(cls, columns, row) for row in rows]
+
+    def load(self, cls):
+        """ Create the table of `cls`: the database is always up to date
+        """
+        self._table(cls)
+
+    def save_all(self, cls):
+        """ Every write is already committed: fold the WAL back into the
+        database file
+        """
+        self._connection().execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def save(self, obj):
+        """ Update the row of the object in place (keeping its position in
+        the insertion order), or insert it
+        Written without UPSERT, which needs SQLite 3.24
+        """
+        cls = obj.__class__
+        serialized = obj._serialized(cache=False)
+        names = tuple(serialized)
+        self._table(cls, names)
+        key = (cls.__name__, names)
+        statements = self._statements.get(key)
+        if statements is None:
+            quoted = ['"{}"'.format(name) for name in names]
+            statements = (
+                'UPDATE "{}" SET {} WHERE id = ?'.format(
+                    cls.__name__, ", ".join("{}=?".format(name)
+                                            for name in quoted)),
+                'INSERT OR IGNORE INTO "{}" ({}) VALUES ({})'.format(
+                    cls.__name__, ", ".join(quoted),
+                    ", ".join("?" for _ in names)))
+            self._statements[key] = statements
+        update, insert = statements
+        values = tuple(serialized.values())
+        conn = self._connection()
+        if conn.execute(update, values + (obj.id,)).rowcount == 0 and \
+                conn.execute(insert, values).rowcount == 0:
+            # Inserted by another process meanwhile
+            conn.execute(update, values + (obj.id,))
+
+    def remove(self, obj):
+        """ Delete the row of the object
+        """
+        self._table(obj.__class__)
+        self._connection().execute(
+            'DELETE FROM "{}" WHERE id = ?'.format(obj.__class__.__name__),
+            (obj.id,))
+
+    def count(self, cls) -> int:
+        """ Count the rows of `cls`
+        """
+        self._table(cls)
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM "{}"'.format(cls.__name__)).fetchone()[0]
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ Return one object by ID (primary key lookup)
+        """
+        objs = self._select(cls, "WHERE id = ?", (id,), "")
+        return objs[0] if objs else None
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search the objects with matching attributes
+        Conditions on columns are answered by SQLite (with the index of
+        INDEXED_ATTRIBUTES), the others are checked on the built objects
+        """
+        columns = self._table(cls)
+        clauses, params, remaining = [], [], {}
+        for k, v in attributes.items():
+            if type(v) is datetime:
+                v = v.strftime(TIMESTAMP_FORMAT)
+            if k in columns and isinstance(v, SQL_TYPES):
+                clauses.append('"{}" IS ?'.format(k))
+                params.append(v)
+            else:
+                remaining[k] = attributes[k]
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        objs = self._select(cls, where, tuple(params))
+        return [obj for obj in objs
+                if all(getattr(obj, k) == v for k, v in remaining.items())]
+
+    def page(self, cls, after: str = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects ordered by ID, starting after the
+        ID `after`
+        """
+        where = "" if after is None else "WHERE id > ?"
+        params = () if after is None else (after,)
+        return self._select(cls, where, params + (
+            -1 if limit is None else limit,), "ORDER BY id LIMIT ?")
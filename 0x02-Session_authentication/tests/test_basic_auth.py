@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests of the throttling of failed Basic credentials
+
+Run from 0x02-Session_authentication:
+    python3 -m unittest discover tests
+"""
+import base64
+import os
+import tempfile
+import unittest
+
+from api.v1.auth.basic_auth import BasicAuth, FAILURE_BURST
+from models.user import User
+
+
+class Request:
+    """The Authorization header and client address of a request."""
+
+    def __init__(self, email: str, password: str, remote_addr: str):
+        """Builds a request with Basic credentials."""
+        credentials = "{}:{}".format(email, password).encode()
+        self.headers = {'Authorization': "Basic " +
+                        base64.b64encode(credentials).decode()}
+        self.remote_addr = remote_addr
+
+
+class TestThrottle(unittest.TestCase):
+    """Failing addresses and emails are throttled, not their owners."""
+
+    GUESSES = int(FAILURE_BURST) + 2
+
+    def setUp(self):
+        """Saves bob@hbtn.io in a temporary directory."""
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        User.load_from_file()
+        self.user = User(email="bob@hbtn.io")
+        self.user.password = "pwd"
+        self.user.save()
+        self.auth = BasicAuth()
+
+    def tearDown(self):
+        """Restores the working directory."""
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        User.load_from_file()
+
+    def test_guesses_from_many_addresses(self):
+        """Guesses spread over addresses throttle the email for them,
+        but the right password from a clean address is accepted."""
+        for n in range(self.GUESSES):
+            self.assertIsNone(self.auth.current_user(
+                Request("bob@hbtn.io", "wrong{}".format(n),
+                        "192.0.2.{}".format(n))))
+        self.assertFalse(self.auth.email_throttle.allow("bob@hbtn.io"))
+        self.assertIsNone(self.auth.current_user(
+            Request("bob@hbtn.io", "pwd", "192.0.2.0")))
+        user = self.auth.current_user(
+            Request("bob@hbtn.io", "pwd", "198.51.100.1"))
+        self.assertEqual(user.id, self.user.id)
+
+    def test_guesses_from_one_address(self):
+        """An address out of tokens is rejected, even with the right
+        password, while other addresses keep working."""
+        for n in range(self.GUESSES):
+            self.auth.current_user(
+                Request("bob@hbtn.io", "wrong{}".format(n), "192.0.2.1"))
+        self.assertIsNone(self.auth.current_user(
+            Request("bob@hbtn.io", "pwd", "192.0.2.1")))
+        user = self.auth.current_user(
+            Request("bob@hbtn.io", "pwd", "198.51.100.1"))
+        self.assertEqual(user.id, self.user.id)
+
+
+if __name__ == '__main__':
+    unittest.main()
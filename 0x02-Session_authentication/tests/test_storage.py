@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Tests of the storage of models, run against every backend: the JSON
+file, the journal and SQLite
+
+Run from 0x02-Session_authentication:
+    python3 -m unittest discover tests
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import models.base
+from models.base import set_backend
+from models.sqlite_storage import SQLiteStorage
+from models.user import User
+
+
+class StorageTests:
+    """get/search/save/remove/count/all/page, for the backend STORAGE."""
+
+    STORAGE = None
+
+    def setUp(self):
+        """Uses the backend on empty files in a temporary directory."""
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.storage = models.base.STORAGE
+        models.base.STORAGE = self.STORAGE
+        if self.STORAGE == 'sqlite':
+            set_backend(SQLiteStorage(os.path.join(self.tmp.name,
+                                                   "models.sqlite3")))
+        User.load_from_file()
+
+    def tearDown(self):
+        """Restores the default backend and the working directory."""
+        set_backend(None)
+        models.base.STORAGE = self.storage
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        User.load_from_file()
+
+    def new_user(self, email: str, first_name: str = None) -> User:
+        """Saves and returns a new user."""
+        user = User(email=email, first_name=first_name)
+        user.password = "pwd"
+        user.save()
+        return user
+
+    def test_save_and_get(self):
+        """A saved user is found by ID, with its attributes."""
+        user = self.new_user("bob@hbtn.io", "Bob")
+        found = User.get(user.id)
+        self.assertEqual(found.id, user.id)
+        self.assertEqual(found.email, "bob@hbtn.io")
+        self.assertEqual(found.first_name, "Bob")
+        self.assertTrue(found.is_valid_password("pwd"))
+        self.assertIsNone(User.get("missing"))
+
+    def test_save_updates(self):
+        """Saving a user again updates it in place."""
+        user = self.new_user("bob@hbtn.io")
+        user.first_name = "Bob"
+        user.save()
+        self.assertEqual(User.count(), 1)
+        self.assertEqual(User.get(user.id).first_name, "Bob")
+
+    def test_search(self):
+        """Search by indexed and plain attributes, in saving order."""
+        bob = self.new_user("bob@hbtn.io", "Bob")
+        other = self.new_user("bob@hbtn.io", "Other")
+        self.new_user("ann@hbtn.io", "Bob")
+        self.assertEqual([u.id for u in User.search({'email': "bob@hbtn.io"})],
+                         [bob.id, other.id])
+        self.assertEqual([u.id for u in User.search({'email': "bob@hbtn.io",
+                                                     'first_name': "Bob"})],
+                         [bob.id])
+        self.assertEqual(User.search({'email': "nobody@hbtn.io"}), [])
+
+    def test_search_after_change(self):
+        """A changed indexed attribute is searched by its new value."""
+        user = self.new_user("bob@hbtn.io")
+        user.email = "robert@hbtn.io"
+        user.save()
+        self.assertEqual(User.search({'email': "bob@hbtn.io"}), [])
+        self.assertEqual([u.id for u in
+                          User.search({'email': "robert@hbtn.io"})],
+                         [user.id])
+
+    def test_remove(self):
+        """A removed user is no longer found."""
+        user = self.new_user("bob@hbtn.io")
+        kept = self.new_user("ann@hbtn.io")
+        user.remove()
+        self.assertIsNone(User.get(user.id))
+        self.assertEqual(User.search({'email': "bob@hbtn.io"}), [])
+        self.assertEqual([u.id for u in User.all()], [kept.id])
+
+    def test_count_and_all(self):
+        """All users are listed in saving order and counted."""
+        users = [self.new_user("user{}@hbtn.io".format(i)) for i in range(5)]
+        self.assertEqual(User.count(), 5)
+        self.assertEqual([u.id for u in User.all()], [u.id for u in users])
+
+    def test_page(self):
+        """Pages follow the ID order from the `after` cursor."""
+        ids = sorted(self.new_user("user{}@hbtn.io".format(i)).id
+                     for i in range(7))
+        self.assertEqual([u.id for u in User.page(None, 3)], ids[:3])
+        self.assertEqual([u.id for u in User.page(ids[2], 3)], ids[3:6])
+        self.assertEqual([u.id for u in User.page(ids[5], 3)], ids[6:])
+        self.assertEqual(User.page(ids[6], 3), [])
+        added = self.new_user("added@hbtn.io")
+        self.assertIn(added.id, [u.id for u in User.page(None, 10)])
+
+    def test_reload(self):
+        """Saved changes are found again after loading from storage."""
+        user = self.new_user("bob@hbtn.io", "Bob")
+        removed = self.new_user("ann@hbtn.io")
+        removed.remove()
+        User.save_to_file()
+        User.load_from_file()
+        self.assertEqual([u.id for u in User.all()], [user.id])
+        self.assertEqual([u.id for u in
+                          User.search({'email': "bob@hbtn.io"})],
+                         [user.id])
+        self.assertTrue(User.get(user.id).is_valid_password("pwd"))
+
+
+class TestJSONStorage(StorageTests, unittest.TestCase):
+    """The whole JSON file rewritten on every write."""
+
+    STORAGE = 'json'
+
+
+class TestJournalStorage(StorageTests, unittest.TestCase):
+    """One journal record appended per write."""
+
+    STORAGE = 'journal'
+
+
+class TestSQLiteStorage(StorageTests, unittest.TestCase):
+    """One SQLite table per class."""
+
+    STORAGE = 'sqlite'
+
+
+class TestWriteBehind(unittest.TestCase):
+    """The flusher thread of the write-behind mode."""
+
+    def setUp(self):
+        """Enables write-behind on empty files in a temporary directory."""
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        patches = [mock.patch.object(models.base, 'WRITE_BEHIND', True),
+                   mock.patch.object(models.base, 'FLUSH_INTERVAL', 0.05)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        User.load_from_file()
+
+    def tearDown(self):
+        """Restores the working directory."""
+        models.base.flush()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        User.load_from_file()
+
+    def wait_until_saved(self, count: int):
+        """Waits for the flusher to write `count` users to the file."""
+        for _ in range(100):
+            if not models.base.DIRTY and os.path.exists(".db_User.json"):
+                break
+            time.sleep(0.02)
+        self.assertEqual(models.base.DIRTY, {})
+        User.load_from_file()
+        self.assertEqual(User.count(), count)
+
+    def test_failed_flush_is_retried(self):
+        """A failing save keeps the class dirty, and the flusher alive."""
+        save_to_file = User.save_to_file
+        failures = [OSError("disk full")]
+
+        def failing_save():
+            """Fails once, then saves."""
+            if failures:
+                raise failures.pop()
+            save_to_file()
+
+        with mock.patch.object(User, 'save_to_file', failing_save), \
+                self.assertLogs('models.base', 'ERROR'):
+            User(email="bob@hbtn.io").save()
+            self.wait_until_saved(1)
+        self.assertEqual(failures, [])
+        User(email="ann@hbtn.io").save()
+        self.wait_until_saved(2)
+
+    def test_load_keeps_pending_changes(self):
+        """load_from_file saves the pending changes before reading."""
+        with mock.patch.object(models.base, 'FLUSH_INTERVAL', 60):
+            User(email="bob@hbtn.io").save()
+            User.load_from_file()
+            self.assertEqual(User.count(), 1)
+
+
+class TestJournalWorkers(unittest.TestCase):
+    """Workers appending to one journal while compacting it."""
+
+    WORKER = ("from models.user import User\n"
+              "User.load_from_file()\n"
+              "for i in range(200):\n"
+              "    User(email='w{}-{}'.format(sys.argv[1], i)).save()\n")
+
+    def test_no_record_lost(self):
+        """Every save of every worker is found after the compactions."""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, MODELS_STORAGE='journal',
+                   MODELS_JOURNAL_MAX_BYTES='5000',
+                   PYTHONPATH=os.pathsep.join(
+                       filter(None, [root, os.getenv('PYTHONPATH')])))
+        with tempfile.TemporaryDirectory() as tmp:
+            workers = [subprocess.Popen(
+                [sys.executable, "-c", "import sys\n" + self.WORKER,
+                 str(n)], cwd=tmp, env=env) for n in range(4)]
+            for worker in workers:
+                self.assertEqual(worker.wait(), 0)
+            count = subprocess.run(
+                [sys.executable, "-c", "from models.user import User\n"
+                 "User.load_from_file()\nprint(User.count())"],
+                cwd=tmp, env=env, stdout=subprocess.PIPE, check=True)
+            self.assertEqual(int(count.stdout), 800)
+            self.assertEqual(sorted(name for name in os.listdir(tmp)
+                                    if name.startswith(".db_User.json")),
+                             [".db_User.json"])
+
+
+if __name__ == '__main__':
+    unittest.main()
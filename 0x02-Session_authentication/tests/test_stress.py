@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Stress test of the storage of models: readers and writers run
+concurrently, then the indexes must match a full scan of the users.
+Run against the JSON file and the journal
+
+Run from 0x02-Session_authentication:
+    python3 -m unittest discover tests
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import models.base
+from models.base import DATA, INDEXES, ORDERED_IDS
+from models.user import User
+
+
+class StressTests:
+    """Concurrent search/get/page and save/remove/load, for STORAGE."""
+
+    STORAGE = None
+    USERS = 200
+    SECONDS = 1.5
+    READERS = 6
+    WRITERS = 3
+
+    def setUp(self):
+        """Saves USERS users with the backend in a temporary directory."""
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.storage = models.base.STORAGE
+        models.base.STORAGE = self.STORAGE
+        User.load_from_file()
+        for i in range(self.USERS):
+            User(email=self.email(i)).save()
+
+    def tearDown(self):
+        """Restores the default backend and the working directory."""
+        models.base.STORAGE = self.storage
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        User.load_from_file()
+
+    def email(self, number: int) -> str:
+        """The email of the user `number`."""
+        return "user{}@hbtn.io".format(number)
+
+    def random_user(self, rng: random.Random) -> User:
+        """A random saved user, or None."""
+        return User.get(rng.choice(ORDERED_IDS.get('User') or [None]))
+
+    def reader(self, stop: threading.Event, errors: list, ops: list):
+        """Searches, gets and pages users until `stop` is set."""
+        rng, done = random.Random(), 0
+        try:
+            while not stop.is_set():
+                email = self.email(rng.randrange(self.USERS))
+                for user in User.search({'email': email}):
+                    assert user.email == email, "torn search result"
+                user = self.random_user(rng)
+                page = User.page(user.id if user else None, 20)
+                ids = [user.id for user in page]
+                assert ids == sorted(ids), "torn page"
+                done += 1
+        except Exception as e:
+            errors.append(repr(e))
+        ops.append(done)
+
+    def writer(self, stop: threading.Event, errors: list, ops: list):
+        """Updates, creates, removes and reloads users until `stop` is set."""
+        rng, done = random.Random(), 0
+        try:
+            while not stop.is_set():
+                action = rng.random()
+                user = self.random_user(rng)
+                if user is None:
+                    continue
+                if action < 0.4:
+                    user.email = self.email(rng.randrange(self.USERS))
+                    user.save()
+                elif action < 0.7:
+                    User(email=user.email).save()
+                elif action < 0.98:
+                    user.remove()
+                else:
+                    User.load_from_file()
+                done += 1
+        except Exception as e:
+            errors.append(repr(e))
+        ops.append(done)
+
+    def run_threads(self) -> tuple:
+        """Runs the readers and writers for SECONDS, returns
+        the errors and the operations done by each thread."""
+        stop, errors, read_ops, write_ops = threading.Event(), [], [], []
+        User.page(None, 1)
+        threads = [threading.Thread(target=self.reader,
+                                    args=(stop, errors, read_ops))
+                   for _ in range(self.READERS)]
+        threads += [threading.Thread(target=self.writer,
+                                     args=(stop, errors, write_ops))
+                    for _ in range(self.WRITERS)]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        try:
+            for thread in threads:
+                thread.start()
+            time.sleep(self.SECONDS)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            sys.setswitchinterval(switch_interval)
+        return errors, read_ops, write_ops
+
+    def assertIndexesMatchScan(self):
+        """The ID order and the email index match a full scan."""
+        users = DATA['User']
+        ids = ORDERED_IDS.get('User')
+        if ids is not None:
+            self.assertEqual(ids, sorted(dict.keys(users)))
+        scan = {}
+        for user in users.values():
+            scan.setdefault(user.email, set()).add(user.id)
+        index = {email: set(bucket)
+                 for email, bucket in INDEXES['User']['email'].items()
+                 if bucket}
+        self.assertEqual(index, scan)
+        for email, user_ids in scan.items():
+            self.assertEqual({u.id for u in User.search({'email': email})},
+                             user_ids)
+
+    def test_concurrent_readers_and_writers(self):
+        """No thread fails, and the indexes match a full scan, in memory
+        and after loading from the file."""
+        errors, read_ops, write_ops = self.run_threads()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(read_ops), self.READERS)
+        self.assertEqual(len(write_ops), self.WRITERS)
+        self.assertGreater(sum(write_ops), 0)
+        self.assertIndexesMatchScan()
+        saved = sorted(dict.keys(DATA['User']))
+        User.load_from_file()
+        self.assertEqual(sorted(dict.keys(DATA['User'])), saved)
+        self.assertIndexesMatchScan()
+
+
+class TestJSONStress(StressTests, unittest.TestCase):
+    """The whole JSON file rewritten on every write."""
+
+    STORAGE = 'json'
+
+
+class TestJournalStress(StressTests, unittest.TestCase):
+    """One journal record appended per write."""
+
+    STORAGE = 'journal'
+
+
+if __name__ == '__main__':
+    unittest.main()